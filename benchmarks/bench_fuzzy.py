@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+模糊搜索基准测试
+用与 bench_history.py 相同词表和长度分布的合成文本测量 FuzzyIndex 的建立时间、文本列大小和每个查询的延迟，
+并与逐条文本用 Python 计算子序列匹配的做法比较
+模糊搜索只比较每条文本开头的 FUZZY_TEXT_CHARS 个字符，所以长文本只生成开头部分，100 万条也能很快生成
+
+用法: python benchmarks/bench_fuzzy.py [--sizes 100000 1000000]
+"""
+
+import os
+import sys
+import time
+import heapq
+import random
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_index import FuzzyIndex, FUZZY_TEXT_CHARS, _fuzzy_text
+from bench_history import WORDS
+
+DEFAULT_SIZES = [100000, 1000000]
+REPEAT = 3  # 每个查询重复次数，取最小值
+LIMIT = 1000  # 结果数量(与 SEARCH_RESULT_LIMIT 相同)
+# 连续子串、子序列(漏输入的字符)、打错一个字符、中文子序列、少量结果(查找打错字符的匹配)、没有结果
+QUERIES = ["lorem", "lrmipsm", "slctfrm", "imprtjsn", "improt", "剪板历", "#3fa9c", "zzzzq"]
+NAIVE_MAX_SIZE = 100000  # 逐条计算的做法太慢，只在不超过此规模时测量
+
+
+def make_texts(size, seed=0):
+    """生成 [(内容键, 文本)]，长度分布同 bench_history.make_text，只保留开头足够长的部分"""
+    rng = random.Random(seed)
+    max_words = FUZZY_TEXT_CHARS // 2
+    texts = []
+    for doc in range(size):
+        r = rng.random()
+        if r < 0.8:
+            count = rng.randint(1, 30)
+        else:
+            count = max_words
+        texts.append((doc.to_bytes(8, 'little'), " ".join(rng.choices(WORDS, k=count)) + f" #{rng.getrandbits(32):x}"))
+    return texts
+
+
+def naive_search(texts, query):
+    """逐条文本用 str.find 计算子序列匹配和匹配范围(不含打错字符的容忍)"""
+    query = _fuzzy_text(query)
+    results = []
+    for key, text in texts:
+        start = end = text.find(query[0])
+        for char in query[1:]:
+            if end < 0:
+                break
+            end = text.find(char, end + 1)
+        if start >= 0 and end >= 0:
+            results.append((len(query) / (end - start + 1), key))
+    return results
+
+
+def best_ms(func, *args):
+    """多次执行取最短耗时(毫秒)，同时返回结果"""
+    best, result = None, None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模糊搜索基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="文本条数")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        texts = make_texts(size)
+        index = FuzzyIndex()
+        start = time.perf_counter()
+        index.reset(texts)
+        index.search("a")  # 第一次搜索时拼接文本列
+        build = (time.perf_counter() - start) * 1000
+        column_mb = sum(sys.getsizeof(block.column) + sys.getsizeof(block.offsets)
+                        for block in index.blocks) / (1024 * 1024)
+        print(f"\n{size} 条: 建立(含第一次搜索) {build:.0f} ms, 文本列 {column_mb:.1f} MB")
+
+        prepared = [(key, _fuzzy_text(text)) for key, text in texts]
+        print(f"{'查询':<12}{'命中':>10}{'模糊 ms':>12}{'前 N 项 ms':>12}{'逐条 ms':>12}")
+        fuzzy_times = []
+        for query in QUERIES:
+            fuzzy_time, results = best_ms(index.search, query)
+            top_time, _ = best_ms(heapq.nlargest, LIMIT, results)
+            fuzzy_times.append(fuzzy_time)
+            naive = "-"
+            if size <= NAIVE_MAX_SIZE:
+                naive = f"{best_ms(naive_search, prepared, query)[0]:.1f}"
+            print(f"{query:<12}{len(results):>10}{fuzzy_time:>12.1f}{top_time:>12.1f}{naive:>12}")
+        print(f"模糊搜索中位数 {statistics.median(fuzzy_times):.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+历史记录引擎基准测试
+用合成的历史记录(文本和图片按常见比例混合)测量 HistoryStore 各个热点操作(含按条件筛选)的延迟、
+进程峰值内存和磁盘占用；每种规模在单独的子进程中运行，峰值内存互不影响；
+每种规模运行 --runs 次，每个指标取最小值，减少机器负载波动造成的误报
+
+用法:
+    python benchmarks/bench_history.py                      # 默认规模 1k/10k/100k
+    python benchmarks/bench_history.py --sizes 1000 1000000 # 指定规模
+    python benchmarks/bench_history.py --save-baseline      # 保存结果为基线
+    python benchmarks/bench_history.py --compare            # 与基线比较，变慢超过阈值时返回非零
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QCoreApplication
+from history_log import HistoryLog, record_key
+from history_item import HistoryItem, from_datetime
+from history_store import HistoryStore
+from blob_store import BlobRef
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline_history.json")
+REGRESSION_RATIO = 1.5  # 比基线慢超过此倍数视为性能退化
+REGRESSION_MIN_DELTA = 0.1  # 与基线的差值不超过此值(毫秒或 MB)时视为测量噪声，不算退化
+IMAGE_RATIO = 0.1  # 图片历史项所占比例
+PINNED_RATIO = 0.01  # 固定项目所占比例
+SAMPLES = 200  # 单项操作的采样次数
+REPEAT_SECONDS = 1.0  # 整体建立索引等一次性操作重复测量的累计时间(秒)，取最短一次
+REPEAT_MAX = 5  # 一次性操作最多重复的次数
+DEFAULT_RUNS = 3  # 每种规模的运行次数(每个指标取最小值)
+SEARCH_QUERIES = ["ab", "lorem", "qux", "^def", "zzzz"]
+FILTER_QUERIES = ["type:image", "is:pinned", "copies:5", "type:text is:unpinned"]  # 只有筛选条件的搜索
+
+# 合成文本使用的词表(包含搜索用的词)
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "def", "return", "import", "class", "self",
+         "http", "https", "www", "com", "json", "error", "warning", "select", "from", "where",
+         "qux", "abc", "ab", "用户", "剪贴板", "历史", "复制", "文件", "数据", "配置"]
+
+
+def make_text(rng):
+    """生成一条文本：多数很短，少数是代码片段或日志(几 KB)，极少数很长(几十 KB)"""
+    r = rng.random()
+    if r < 0.8:
+        count = rng.randint(1, 30)
+    elif r < 0.99:
+        count = rng.randint(100, 800)
+    else:
+        count = rng.randint(5000, 10000)
+    return " ".join(rng.choice(WORDS) for _ in range(count)) + f" #{rng.getrandbits(32):x}"
+
+
+def make_history(size, seed=0):
+    """生成 {内容键: HistoryItem}，图片只生成 BlobRef(不写入图片内容)"""
+    rng = random.Random(seed)
+    now = datetime.now()
+    records = {}
+    while len(records) < size:
+        timestamp = from_datetime(now - timedelta(seconds=rng.randint(0, 180 * 86400)))
+        copy_count = int(rng.expovariate(0.5))
+        is_pinned = rng.random() < PINNED_RATIO
+        if rng.random() < IMAGE_RATIO:
+            key = rng.getrandbits(128).to_bytes(16, 'little')
+            content = BlobRef(key, rng.randint(50, 5000) * 1024)
+            item = HistoryItem(key, "image", content, timestamp, copy_count, is_pinned)
+        else:
+            content = make_text(rng)
+            key = record_key("text", content)
+            item = HistoryItem(key, "text", content, timestamp, copy_count, is_pinned)
+        records[key] = item
+    return records
+
+
+def dir_size(path):
+    """目录下全部文件的总字节数"""
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def timed(func):
+    """执行一次，返回耗时(毫秒)"""
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) * 1000
+
+
+def best_ms(func, setup):
+    """每次先调用 setup 再测量 func，重复到累计超过 REPEAT_SECONDS 秒(至少一次，最多 REPEAT_MAX 次)，返回最短耗时(毫秒)"""
+    times = []
+    while len(times) < REPEAT_MAX and sum(times) < REPEAT_SECONDS * 1000:
+        setup()
+        times.append(timed(func))
+    return min(times)
+
+
+def median_ms(func, args_list):
+    """对每组参数各执行一次，返回耗时中位数(毫秒)"""
+    return statistics.median(timed(lambda: func(*args)) for args in args_list)
+
+
+def generate(size, data_dir):
+    """生成合成历史并写入日志"""
+    HistoryLog(os.path.join(data_dir, ".clipboard_history.log")).compact(make_history(size))
+
+
+def run_size(data_dir):
+    """测量 data_dir 中的历史记录，返回结果字典"""
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    rng = random.Random(1)
+    results = {}
+    store = HistoryStore(data_dir)
+    store.evictor.configure({"text": (None, None), "image": (None, None)})  # 不限制容量，避免加载时淘汰
+    first_screen = []
+    start = time.perf_counter()
+    store.itemsLoaded.connect(lambda items: first_screen or first_screen.append(time.perf_counter() - start))
+    store.load(wait=True)
+    results["load"] = (time.perf_counter() - start) * 1000
+    results["first_screen"] = first_screen[0] * 1000 if first_screen else results["load"]
+    # 加载期间空闲时已经建立了一部分搜索索引，每次清空后重新建立全部，测量结果不受调度影响
+    store.finish_indexing()
+    text_keys = [key for key, item in store.items.items() if item.content_type == "text"]
+
+    def reset_search_index():
+        store.search_index.clear()
+        store.unindexed.extend(text_keys)
+
+    results["index"] = best_ms(store.finish_indexing, reset_search_index)
+    # 二级索引在第一次按条件查询时建立；之后的修改都要同步维护，所以先建立再测量修改
+    results["attributes"] = best_ms(store.attribute_index, lambda: setattr(store, "attributes", None))
+
+    keys = list(store.items)
+    texts = [item.content for item in store.items.values() if item.content_type == "text"]
+    new_texts = [(make_text(rng),) for _ in range(SAMPLES)]
+    results["add"] = median_ms(lambda text: store.add("text", text), new_texts)
+    results["add_duplicate"] = median_ms(lambda text: store.add("text", text),
+                                         [(rng.choice(texts),) for _ in range(SAMPLES)])
+    sample_keys = [(rng.choice(keys),) for _ in range(SAMPLES)]
+    results["touch"] = median_ms(store.touch, sample_keys)
+    results["pin"] = median_ms(lambda key: store.set_pinned(key, True), sample_keys)
+    results["query"] = median_ms(store.query, [(rule,) for rule in (0, 1, 2)])
+    results["search"] = median_ms(store.search, [(query,) for query in SEARCH_QUERIES])
+    results["filter"] = median_ms(store.search, [(query,) for query in FILTER_QUERIES])
+    results["frecent"] = median_ms(lambda: store.frecent_items(10), [()] * SAMPLES)
+    day = store.query(1)[len(store) // 2].timestamp
+    results["find_day"] = median_ms(lambda: store.find(start=day - day % 86400000000, end=day, limit=100),
+                                    [()] * SAMPLES)
+    results["compact"] = timed(lambda: store.history_log.compact(store.items))
+    results["close"] = timed(store.close)
+    app.processEvents()
+
+    # Linux 上 ru_maxrss 以 KB 为单位，macOS 上以字节为单位
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results["peak_rss_mb"] = max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    results["disk_mb"] = dir_size(data_dir) / (1024 * 1024)
+    return results
+
+
+def run_in_subprocess(size):
+    """生成和测量分别在子进程中进行，峰值内存只包含测量过程"""
+    data_dir = tempfile.mkdtemp(prefix="bench_history_")
+    script = os.path.abspath(__file__)
+    try:
+        subprocess.run([sys.executable, script, "--generate", str(size), data_dir], check=True)
+        output = subprocess.run([sys.executable, script, "--measure", data_dir],
+                                check=True, capture_output=True, text=True).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_table(results, baseline=None):
+    """打印结果，有基线时附上与基线的比值"""
+    metrics = list(next(iter(results.values())))
+    print(f"{'指标':<14}" + "".join(f"{size:>16}" for size in results))
+    for metric in metrics:
+        cells = []
+        for size, values in results.items():
+            cell = f"{values[metric]:.3f}"
+            base = (baseline or {}).get(str(size), {}).get(metric)
+            if base:
+                cell += f" ({values[metric] / base:.2f}x)"
+            cells.append(f"{cell:>16}")
+        print(f"{metric:<14}" + "".join(cells))
+    print("延迟单位为毫秒(单项操作取中位数)，peak_rss_mb/disk_mb 单位为 MB")
+
+
+def find_regressions(results, baseline):
+    """找出比基线慢超过 REGRESSION_RATIO 倍且差值超过 REGRESSION_MIN_DELTA 的指标"""
+    regressions = []
+    for size, values in results.items():
+        for metric, value in values.items():
+            base = baseline.get(str(size), {}).get(metric)
+            if base and value > base * REGRESSION_RATIO and value - base > REGRESSION_MIN_DELTA:
+                regressions.append(f"{size} {metric}: {base:.3f} -> {value:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史记录引擎基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="历史记录规模")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="每种规模的运行次数，每个指标取最小值")
+    parser.add_argument("--save-baseline", action="store_true", help="把结果保存为基线")
+    parser.add_argument("--compare", action="store_true", help="与基线比较")
+    # 以下两个参数由子进程内部使用
+    parser.add_argument("--generate", nargs=2, metavar=("SIZE", "DIR"), help=argparse.SUPPRESS)
+    parser.add_argument("--measure", metavar="DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.generate:
+        generate(int(args.generate[0]), args.generate[1])
+        return 0
+    if args.measure:
+        print(json.dumps(run_size(args.measure)))
+        return 0
+
+    results = {}
+    for size in args.sizes:
+        print(f"测量 {size} 项...", file=sys.stderr)
+        runs = [run_in_subprocess(size) for _ in range(max(args.runs, 1))]
+        results[size] = {metric: min(run[metric] for run in runs) for metric in runs[0]}
+
+    baseline = None
+    if args.compare and os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("machine") != platform.platform():
+            print(f"注意: 基线来自 {saved.get('machine')}，与当前机器不同", file=sys.stderr)
+        baseline = saved["results"]
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+            json.dump({"machine": platform.platform(), "python": platform.python_version(),
+                       "results": {str(size): values for size, values in results.items()}},
+                      f, indent=2, ensure_ascii=False)
+        print(f"基线已保存到 {BASELINE_PATH}")
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline)
+        if regressions:
+            print("性能退化:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
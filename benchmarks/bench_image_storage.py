@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+图片存储基准测试
+比较原始 TIFF 与无损 PNG 转码后的磁盘占用，以及复制回剪贴板时还原为 TIFF 的延迟
+
+用法: python benchmarks/bench_image_storage.py
+"""
+
+import io
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+from blob_store import encode_lossless, decode_to_tiff
+
+# 截图常见尺寸
+SIZES = [(400, 300), (1280, 800), (2560, 1600), (5120, 2880)]
+REPEAT = 3  # 每项重复次数，取最小值
+
+
+def make_screenshot(width, height, seed=0):
+    """生成类似截图的图片：大面积纯色背景、窗口块、文字状的细节和一块照片状的噪声区域"""
+    rng = random.Random(seed)
+    image = Image.new("RGBA", (width, height), (236, 236, 236, 255))
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        x0, y0 = rng.randrange(width), rng.randrange(height)
+        x1, y1 = min(width, x0 + rng.randrange(100, width // 2 + 101)), min(height, y0 + rng.randrange(80, height // 2 + 81))
+        draw.rectangle((x0, y0, x1, y1), fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256), 255))
+    for line in range(0, height, 18):
+        x = 20
+        while x < width - 40 and rng.random() < 0.97:
+            word = rng.randrange(10, 60)
+            draw.rectangle((x, line + 4, x + word, line + 12), fill=(40, 40, 40, 255))
+            x += word + 8
+    photo = Image.effect_noise((width // 3, height // 3), 40).convert("RGBA")
+    image.paste(photo, (width // 2, height // 2))
+    buffer = io.BytesIO()
+    image.save(buffer, "TIFF")
+    return buffer.getvalue()
+
+
+def best_of(func, *args):
+    """多次执行取最短耗时(毫秒)，同时返回结果"""
+    best, result = None, None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    print(f"{'尺寸':>12} {'TIFF(KB)':>10} {'PNG(KB)':>10} {'压缩比':>8} {'转码(ms)':>10} {'还原(ms)':>10}")
+    for width, height in SIZES:
+        tiff = make_screenshot(width, height)
+        encode_ms, png = best_of(encode_lossless, tiff)
+        restore_ms, restored = best_of(decode_to_tiff, png)
+
+        # 校验像素无损
+        with Image.open(io.BytesIO(tiff)) as a, Image.open(io.BytesIO(restored)) as b:
+            assert a.tobytes() == b.tobytes(), "还原后的像素与原图不一致"
+
+        print(f"{width}x{height:<7} {len(tiff) / 1024:>10.0f} {len(png) / 1024:>10.0f} "
+              f"{len(tiff) / len(png):>7.1f}x {encode_ms:>10.1f} {restore_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
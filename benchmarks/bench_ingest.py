@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+文本接收基准测试
+用 tracemalloc 测量一次剪贴板文本变化从监视器读取到写入磁盘期间额外分配的峰值内存(相对文本 UTF-8 大小的倍数)和耗时：
+1. legacy: 旧流程(监视器编码为字节，add 再解码，计算内容键时去空白再编码，存入二进制存储时又编码一次)
+2. current: 当前流程(文本只编码一次，内容键和二进制存储共用这份编码)
+3. pipeline: MemoryBackend -> PasteboardMonitor -> HistoryStore -> 后台写入的完整路径
+
+用法: python benchmarks/bench_ingest.py [--sizes 1024 1048576]
+"""
+
+import os
+import sys
+import time
+import shutil
+import hashlib
+import argparse
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt6.QtCore import QCoreApplication
+from clipboard_backend import MemoryBackend, TYPE_TEXT
+from clipboard_monitor import PasteboardMonitor
+from history_log import encode_text, text_key
+from history_store import HistoryStore
+
+KB = 1024
+MB = 1024 * 1024
+DEFAULT_SIZES = [KB, 64 * KB, MB, 10 * MB, 50 * MB]
+LINE = "2024-05-01 12:00:00 INFO 剪贴板 request handled in 12ms path=/api/v1/items?id=42\n"
+
+
+def make_text(size):
+    """生成 UTF-8 编码约为 size 字节的日志状文本(以换行结尾，计算内容键时需要去掉尾部空白)"""
+    line_bytes = len(LINE.encode('utf-8'))
+    return LINE * max(1, size // line_bytes)
+
+
+def legacy_ingest(text):
+    """旧流程的编码和解码"""
+    data = text.encode('utf-8')  # 监视器发出字节
+    content = data.decode('utf-8')  # add 解码
+    digest = hashlib.blake2b(b'text', digest_size=16)
+    digest.update(b'\0')
+    digest.update(content.strip().encode('utf-8'))  # 内容键
+    return content.encode('utf-8')  # 存入二进制存储
+
+
+def current_ingest(text):
+    """当前流程的编码"""
+    data = encode_text(text)
+    text_key(text, data)
+    return data
+
+
+def traced(func, *args):
+    """执行一次，返回 (额外分配的峰值字节数, 耗时毫秒)"""
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = (time.perf_counter() - start) * 1000
+    peak = tracemalloc.get_traced_memory()[1] - base
+    del result
+    return peak, elapsed
+
+
+def pipeline(text):
+    """完整路径：在新的数据目录中接收一次文本并等待后台写入完成"""
+    data_dir = tempfile.mkdtemp(prefix="bench_ingest_")
+    try:
+        store = HistoryStore(data_dir)
+        store.load(wait=True)
+        backend = MemoryBackend()
+        monitor = PasteboardMonitor(backend)
+        monitor.clipboardChanged.connect(store.add)
+        backend.write(TYPE_TEXT, text)
+
+        def ingest():
+            monitor.check()
+            store.close()  # 写完队列中的变更
+        result = traced(ingest)
+        assert len(store) == 1
+        return result
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本接收基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="文本的 UTF-8 字节数")
+    args = parser.parse_args()
+
+    app = QCoreApplication.instance() or QCoreApplication(sys.argv[:1])
+    tracemalloc.start()
+    print(f"{'大小':>10}{'legacy 倍数':>14}{'current 倍数':>14}{'pipeline 倍数':>15}"
+          f"{'legacy ms':>12}{'current ms':>12}{'pipeline ms':>13}")
+    for size in args.sizes:
+        text = make_text(size)
+        actual = len(text.encode('utf-8'))
+        legacy_peak, legacy_time = traced(legacy_ingest, text)
+        current_peak, current_time = traced(current_ingest, text)
+        pipeline_peak, pipeline_time = pipeline(text)
+        label = f"{actual / MB:.2f}MB" if actual >= MB else f"{actual / KB:.0f}KB"
+        print(f"{label:>10}{legacy_peak / actual:>14.2f}{current_peak / actual:>14.2f}{pipeline_peak / actual:>15.2f}"
+              f"{legacy_time:>12.2f}{current_time:>12.2f}{pipeline_time:>13.2f}")
+    print("倍数 = 额外分配的峰值内存 / 文本 UTF-8 大小")
+    app.processEvents()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+历史日志序列化基准测试
+用 bench_history.py 的合成历史比较旧版逐条 pickle 与当前 struct 记录格式的编码/解码吞吐量和日志大小，
+另测量 HistoryLog 按当前格式整体写入(compact)和加载的耗时
+
+用法: python benchmarks/bench_serialization.py [--sizes 10000 100000]
+"""
+
+import os
+import sys
+import time
+import pickle
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history_log import HistoryLog, OP_PUT
+from history_item import to_datetime
+from record_format import encode_op, decode_op
+from bench_history import make_history
+
+DEFAULT_SIZES = [10000, 100000]
+REPEAT = 3  # 每项重复次数，取最小值
+
+
+def pickle_encode(op):
+    """旧版日志的记录编码"""
+    return pickle.dumps(op, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def best_of(func, *args):
+    """多次执行取最短耗时(秒)，同时返回结果"""
+    best, result = None, None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def measure_codec(name, encode, decode, ops):
+    """测量一种编码的编码和解码吞吐量"""
+    encode_time, payloads = best_of(lambda: [encode(op) for op in ops])
+    decode_time, _ = best_of(lambda: [decode(payload) for payload in payloads])
+    total = sum(len(payload) for payload in payloads)
+    mb = total / (1024 * 1024)
+    print(f"{name:<10}{len(ops) / encode_time:>14,.0f}{mb / encode_time:>12.1f}"
+          f"{len(ops) / decode_time:>14,.0f}{mb / decode_time:>12.1f}{mb:>10.2f}")
+
+
+def measure_log(records):
+    """HistoryLog 按当前格式整体写入和加载的耗时(毫秒)"""
+    data_dir = tempfile.mkdtemp(prefix="bench_serialization_")
+    try:
+        log = HistoryLog(os.path.join(data_dir, "history.log"))
+        compact_time, _ = best_of(log.compact, records)
+        log.close()
+        load_time, loaded = best_of(HistoryLog(log.path).load)
+        assert len(loaded) == len(records)
+        print(f"HistoryLog: compact {compact_time * 1000:.1f} ms, load {load_time * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="历史日志序列化基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="历史记录规模")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        records = make_history(size)
+        ops = [(OP_PUT, key, item.content_type, item.content, item.timestamp, item.copy_count, item.is_pinned)
+               for key, item in records.items()]
+        legacy_ops = [op[:4] + (to_datetime(op[4]),) + op[5:] for op in ops]  # 旧版记录的时间戳是 datetime
+        print(f"\n{size} 项")
+        print(f"{'格式':<10}{'编码 条/秒':>14}{'编码 MB/s':>12}{'解码 条/秒':>14}{'解码 MB/s':>12}{'大小 MB':>10}")
+        measure_codec("pickle", pickle_encode, pickle.loads, legacy_ops)
+        measure_codec("struct", encode_op, decode_op, ops)
+        measure_log(records)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内容寻址的二进制存储
+1. 图片和超长文本的内容按内容键保存为独立文件，历史记录中只保留 BlobRef
+2. BlobRef 只包含内容键、大小和一个很小的预览(图片缩略图或文本开头)
+3. 完整内容只在复制回剪贴板时按需读取
+4. 图片先按原样写入，再由后台线程无损转码为 PNG，复制回剪贴板时再还原为 TIFF；
+   不能无损转码或转码后不更小的图片改名为 .raw，之后不再尝试
+"""
+
+import os
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # 缺少 Pillow 时不生成缩略图
+    Image = None
+
+LARGE_TEXT_CHARS = 256 * 1024  # 超过此长度的文本存入二进制存储
+TEXT_PREVIEW_CHARS = 64 * 1024  # 超长文本在记录中保留的开头字符数
+THUMBNAIL_SIZE = 64  # 记录中缩略图的最大边长(像素)
+PNG_SUFFIX = '.png'  # 转码后的图片文件后缀
+RAW_SUFFIX = '.raw'  # 决定保留原始格式的图片文件后缀
+LOSSLESS_MODES = {"1", "L", "LA", "P", "RGB", "RGBA", "I;16"}  # PNG 可以无损保存的像素格式
+
+
+class BlobRef:
+    """二进制存储中一项内容的引用"""
+    __slots__ = ('key', 'size', 'preview')
+
+    def __init__(self, key, size, preview=None):
+        self.key = key  # 内容键(同时是存储文件名)
+        self.size = size  # 原始内容字节数
+        self.preview = preview  # 图片为 PNG 缩略图字节，文本为开头部分的字符串
+
+    def __getstate__(self):
+        return (self.key, self.size, self.preview)
+
+    def __setstate__(self, state):
+        self.key, self.size, self.preview = state
+
+    def __repr__(self):
+        return f"BlobRef({self.key.hex()}, {self.size})"
+
+
+def decode_text(content):
+    """文本内容转为字符串"""
+    return content.decode('utf-8', errors='replace') if isinstance(content, bytes) else str(content)
+
+
+def content_text(content):
+    """文本历史项用于显示和搜索的字符串(超长文本只返回开头部分)"""
+    if isinstance(content, BlobRef):
+        return content.preview or ""
+    text = decode_text(content)
+    return text[:TEXT_PREVIEW_CHARS] if len(text) > LARGE_TEXT_CHARS else text
+
+
+def make_thumbnail(data, size=(THUMBNAIL_SIZE, THUMBNAIL_SIZE)):
+    """生成不超过 size(宽, 高)的 PNG 缩略图，失败或缺少 Pillow 时返回 None"""
+    if Image is None:
+        return None
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail(size)
+            buffer = io.BytesIO()
+            image.save(buffer, 'PNG')
+            return buffer.getvalue()
+    except Exception as e:
+        print(f"生成缩略图失败: {e}")
+        return None
+
+
+def image_params(image):
+    """转码时需要保留的图片元数据(色彩配置和分辨率)"""
+    params = {}
+    if image.info.get('icc_profile'):
+        params['icc_profile'] = image.info['icc_profile']
+    if image.info.get('dpi'):
+        params['dpi'] = tuple(round(v) for v in image.info['dpi'])
+    return params
+
+
+def encode_lossless(data):
+    """
+    把图片无损转码为 PNG，并校验解码后的像素与原图完全一致
+    不能无损转码(多帧、CMYK 等)或缺少 Pillow 时返回 None
+    """
+    if Image is None:
+        return None
+    with Image.open(io.BytesIO(data)) as image:
+        if getattr(image, 'n_frames', 1) > 1 or image.mode not in LOSSLESS_MODES:
+            return None
+        mode, size, pixels = image.mode, image.size, image.tobytes()
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', **image_params(image))
+    png = buffer.getvalue()
+    with Image.open(io.BytesIO(png)) as check:
+        if check.mode != mode or check.size != size or check.tobytes() != pixels:
+            return None
+    return png
+
+
+def decode_to_tiff(png):
+    """把转码保存的 PNG 还原为剪贴板使用的 TIFF"""
+    with Image.open(io.BytesIO(png)) as image:
+        buffer = io.BytesIO()
+        image.save(buffer, 'TIFF', **image_params(image))
+        return buffer.getvalue()
+
+
+class BlobStore:
+    """
+    按内容键存放二进制内容的目录
+    图片先保存原始字节，转码完成后换成同名的 .png 文件，决定不转码时改名为 .raw 文件
+    """
+    def __init__(self, root, transcode=True):
+        self.root = root
+        self.executor = None
+        if transcode and Image is not None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="blob-transcode")
+
+    def path(self, key):
+        """内容键对应的文件路径(按前两位十六进制分目录)"""
+        name = key.hex()
+        return os.path.join(self.root, name[:2], name)
+
+    @staticmethod
+    def _write(path, data):
+        """先写临时文件再原子替换"""
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def put(self, key, data, image=False):
+        """写入内容(已存在时跳过)；图片随后在后台转码"""
+        path = self.path(key)
+        if any(os.path.exists(path + suffix) for suffix in ('', PNG_SUFFIX, RAW_SUFFIX)):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._write(path, data)
+        if image:
+            self.schedule_transcode([key])
+
+    def schedule_transcode(self, keys):
+        """把尚未转码的图片交给后台线程转码(.raw 文件已决定保留原始格式，不再尝试)"""
+        if self.executor is None:
+            return
+        for key in keys:
+            if os.path.exists(self.path(key)):
+                self.executor.submit(self.transcode, key)
+
+    def transcode(self, key):
+        """
+        把原始图片转码为 PNG，写入成功后再删除原始文件(在后台线程中执行)
+        不能无损转码或转码后不更小时把原始文件改名为 .raw，记录这个决定
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            png = encode_lossless(data)
+            if png is None or len(png) >= len(data):
+                os.replace(path, path + RAW_SUFFIX)
+                return
+            self._write(path + PNG_SUFFIX, png)
+        except FileNotFoundError:
+            return  # 转码前内容已被删除
+        except Exception as e:
+            print(f"图片转码失败: {e}")
+            return
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            self.delete(key)  # 转码期间内容已被删除
+
+    def get(self, key):
+        """读取内容，转码过的图片还原为 TIFF"""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+        try:
+            # 转码时先写 PNG 再删原始文件，所以原始文件不存在时 PNG 或 .raw 一定存在
+            with open(path + PNG_SUFFIX, 'rb') as f:
+                return decode_to_tiff(f.read())
+        except FileNotFoundError:
+            with open(path + RAW_SUFFIX, 'rb') as f:
+                return f.read()
+
+    def load(self, content_type, content):
+        """取得历史项的完整内容：文本返回字符串，图片返回字节"""
+        if isinstance(content, BlobRef):
+            data = self.get(content.key)
+            return data.decode('utf-8', errors='replace') if content_type == "text" else data
+        if content_type == "text":
+            return decode_text(content)
+        return content
+
+    def delete(self, key):
+        """删除内容"""
+        path = self.path(key)
+        for name in (path, path + PNG_SUFFIX, path + RAW_SUFFIX):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+    def sweep(self, live_keys):
+        """删除不再被任何历史记录引用的内容(以及写入中断留下的临时文件)"""
+        if not os.path.isdir(self.root):
+            return
+        live_names = {key.hex() for key in live_keys}
+        for sub in os.listdir(self.root):
+            sub_path = os.path.join(self.root, sub)
+            if not os.path.isdir(sub_path):
+                continue
+            for name in os.listdir(sub_path):
+                if name.removesuffix(PNG_SUFFIX).removesuffix(RAW_SUFFIX) not in live_names:
+                    os.remove(os.path.join(sub_path, name))
+
+
+def externalize(blob_store, key, content_type, content, data=None):
+    """
+    把图片或超长文本存入二进制存储，返回记录中使用的内容
+    其他内容原样返回；data 为文本接收时已经算好的 UTF-8 编码，省略时重新编码
+    """
+    if isinstance(content, BlobRef):
+        return content
+    if content_type == "image":
+        data = bytes(content)
+        blob_store.put(key, data, image=True)
+        return BlobRef(key, len(data), make_thumbnail(data))
+    if content_type == "text" and len(content) > LARGE_TEXT_CHARS:
+        if data is None:
+            data = content.encode('utf-8', errors='surrogatepass') if isinstance(content, str) else bytes(content)
+        blob_store.put(key, data)
+        return BlobRef(key, len(data), content_text(content))
+    return content
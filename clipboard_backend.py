@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板平台后端接口
+1. 历史记录逻辑只通过 ClipboardBackend 访问系统剪贴板和系统主题，不直接依赖 AppKit
+2. MacBackend(macos_backend.py) 使用 NSPasteboard，只在 macOS 上按需导入
+3. MemoryBackend 在内存中模拟剪贴板，可以按顺序高速重放录制的剪贴板操作，用于无界面测试和压测
+"""
+
+import os
+import sys
+import json
+import base64
+from abc import ABC, abstractmethod
+from PyQt6.QtCore import QObject, pyqtSignal
+
+TYPE_TEXT = "public.utf8-plain-text"  # 文本内容类型
+TYPE_TIFF = "public.tiff"  # 图片内容类型
+
+# 历史项内容类型对应的剪贴板类型
+PASTEBOARD_TYPES = {"text": TYPE_TEXT, "image": TYPE_TIFF}
+
+
+class ClipboardSignals(QObject):
+    """后端发出的系统通知"""
+    pasteboardNotified = pyqtSignal()  # 系统通知剪贴板已变化
+    themeChanged = pyqtSignal(bool)  # 系统主题变化(是否为暗色)
+
+
+class ClipboardBackend(ABC):
+    """剪贴板后端接口，缺少任何一个抽象方法的后端在创建时就会报错"""
+
+    @abstractmethod
+    def change_count(self):
+        """剪贴板内容每次变化都会改变的计数(读取开销应当很小)"""
+
+    @abstractmethod
+    def types(self):
+        """当前剪贴板内容的类型列表"""
+
+    @abstractmethod
+    def read(self, pasteboard_type):
+        """读取指定类型的内容：文本返回 str，其他类型返回 bytes，没有时返回 None"""
+
+    @abstractmethod
+    def write(self, pasteboard_type, data):
+        """清空剪贴板并写入一种类型的内容"""
+
+    def is_dark_theme(self):
+        """系统当前是否为暗色主题"""
+        return False
+
+    def watch(self, signals):
+        """开始监听系统的剪贴板和主题通知，通过 signals(ClipboardSignals) 发出"""
+
+
+class MemoryBackend(ClipboardBackend):
+    """内存中的剪贴板，结果完全确定，并统计内容读取次数"""
+
+    def __init__(self):
+        self.count = 0
+        self.payloads = {}  # 剪贴板类型 -> 内容
+        self.dark = False
+        self.reads = 0  # read 的调用次数
+        self.signals = None
+
+    def change_count(self):
+        return self.count
+
+    def types(self):
+        return list(self.payloads)
+
+    def read(self, pasteboard_type):
+        self.reads += 1
+        return self.payloads.get(pasteboard_type)
+
+    def write(self, pasteboard_type, data):
+        self.payloads = {pasteboard_type: data}
+        self.count += 1
+
+    def is_dark_theme(self):
+        return self.dark
+
+    def watch(self, signals):
+        self.signals = signals
+
+    def set_dark_theme(self, is_dark):
+        """切换模拟的系统主题"""
+        if is_dark != self.dark:
+            self.dark = is_dark
+            if self.signals is not None:
+                self.signals.themeChanged.emit(is_dark)
+
+    def replay(self, events, on_change=None):
+        """
+        按顺序把 events([(剪贴板类型, 内容)])写入剪贴板
+        每写入一项调用一次 on_change(例如监视器的 check)，返回写入的数量
+        """
+        replayed = 0
+        for pasteboard_type, data in events:
+            self.write(pasteboard_type, data)
+            if on_change is not None:
+                on_change()
+            replayed += 1
+        return replayed
+
+
+def save_trace(path, events):
+    """把剪贴板操作 [(剪贴板类型, 内容)] 保存为 JSON Lines 文件(二进制内容用 base64)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        for pasteboard_type, data in events:
+            if isinstance(data, str):
+                record = {"type": pasteboard_type, "text": data}
+            else:
+                record = {"type": pasteboard_type, "data": base64.b64encode(data).decode('ascii')}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def load_trace(path):
+    """逐条读取 save_trace 保存的剪贴板操作"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "text" in record:
+                yield record["type"], record["text"]
+            else:
+                yield record["type"], base64.b64decode(record["data"])
+
+
+def create_backend():
+    """
+    创建当前平台的后端
+    环境变量 CLIPBOARD_BACKEND=memory 或非 macOS 平台时使用 MemoryBackend
+    """
+    name = os.environ.get("CLIPBOARD_BACKEND")
+    if name == "memory" or (name is None and sys.platform != "darwin"):
+        return MemoryBackend()
+    from macos_backend import MacBackend
+    return MacBackend()
@@ -10,27 +10,29 @@ Mac剪贴板历史管理器 - 菜单栏功能版
 
 import sys
 import os
-import pickle
-from datetime import datetime
+import signal
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QLabel, 
-                            QScrollArea, QPushButton, QHBoxLayout, QFrame, QSizePolicy,
-                            QLineEdit, QTextEdit, QMessageBox, QDialog, QSlider, 
-                            QComboBox, QFormLayout, QMenu, QSystemTrayIcon)
-from PyQt6.QtCore import Qt, QSize, pyqtSignal, QObject, QTimer
-from PyQt6.QtGui import QIcon, QColor, QTextOption, QAction, QGuiApplication
-from AppKit import NSPasteboard, NSObject, NSData
-from PyQt6.QtWidgets import QGraphicsDropShadowEffect
-import objc
-from Foundation import NSDistributedNotificationCenter
-from Cocoa import NSApplication, NSApp
-import pyperclip
+                            QListView, QPushButton, QHBoxLayout, QFrame, QAbstractItemView,
+                            QLineEdit, QMessageBox, QDialog, QSlider, 
+                            QComboBox, QFormLayout, QMenu, QSystemTrayIcon,
+                            QPlainTextEdit, QScrollArea)
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtGui import QIcon, QColor, QAction, QGuiApplication, QPixmap
+from history_view import HistoryListModel, HistoryItemDelegate, MARGIN
+from history_store import HistoryStore, LOAD_COPY, LOAD_DETAIL
+from ingest_queue import IngestQueue
+from history_eviction import EVICT_LRU
+from thumbnail_cache import ThumbnailCache
+from clipboard_monitor import PasteboardMonitor
+from clipboard_backend import ClipboardSignals, PASTEBOARD_TYPES, create_backend
+from record_format import decode_settings
+from blob_store import content_text
 
 # 常量定义
-MAX_HISTORY_ITEMS = 1000000  # 历史记录中保存的最大项目数量
-ITEM_HEIGHT = 100  # 每个历史记录项的高度(像素)
-MARGIN = 10  # 统一边距(像素)
-CLIPBOARD_CHECK_INTERVAL = 0.5  # 剪贴板检查间隔(秒)
 DEFAULT_OPACITY = 80  # 窗口默认透明度百分比(0-100)
+SEARCH_DEBOUNCE_MS = 150  # 搜索防抖间隔(毫秒)
+FRECENT_MENU_ITEMS = 10  # 常用菜单中列出的项目数量
+MENU_TITLE_CHARS = 40  # 菜单项标题的最大字符数
 
 class AboutDialog(QDialog):
     """关于对话框"""
@@ -117,6 +119,49 @@ class OpacityDialog(QDialog):
         
         self.setLayout(layout)
 
+class HistoryDetailDialog(QDialog):
+    """查看历史项的完整内容(列表中只显示预览)"""
+    def __init__(self, item, content, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("完整内容")
+        self.resize(480, 400)
+        
+        layout = QVBoxLayout()
+        layout.setContentsMargins(10, 10, 10, 10)
+        
+        if item.content_type == "text":
+            view = QPlainTextEdit()
+            view.setReadOnly(True)
+            view.setPlainText(content)
+        else:
+            pixmap = QPixmap()
+            pixmap.loadFromData(content)
+            image_label = QLabel()
+            image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            image_label.setPixmap(pixmap)
+            view = QScrollArea()
+            view.setWidget(image_label)
+            view.setWidgetResizable(True)
+        
+        # 按钮布局
+        button_layout = QHBoxLayout()
+        button_layout.addStretch()
+        
+        copy_button = QPushButton("复制")
+        copy_button.clicked.connect(lambda: parent.write_to_clipboard(item, content))
+        
+        close_button = QPushButton("关闭")
+        close_button.clicked.connect(self.accept)
+        
+        button_layout.addWidget(copy_button)
+        button_layout.addWidget(close_button)
+        
+        # 添加到主布局
+        layout.addWidget(view)
+        layout.addLayout(button_layout)
+        
+        self.setLayout(layout)
+
 class SortDialog(QDialog):
     """排序规则设置对话框"""
     def __init__(self, parent=None):
@@ -132,7 +177,8 @@ class SortDialog(QDialog):
         self.sort_combo.addItems([
             "按修改时间(最旧在前)", 
             "按修改时间(最新在前)", 
-            "按复制次数(最多在前)"
+            "按复制次数(最多在前)",
+            "按常用程度(复制次数和最近使用)"
         ])
         
         # 按钮布局
@@ -156,270 +202,36 @@ class SortDialog(QDialog):
         
         self.setLayout(layout)
 
-class ClipboardSignals(QObject):
-    clipboardChanged = pyqtSignal(str, bytes)
-    themeChanged = pyqtSignal(bool)
-
-class ClipboardMonitor(NSObject):
-    def init(self):
-        self = objc.super(ClipboardMonitor, self).init()
-        if not self:
-            return None
-            
-        self.signals = ClipboardSignals()
-        self.last_content = None
-        self.current_theme_dark = False
-        
-        # 设置剪贴板变化通知
-        center = NSDistributedNotificationCenter.defaultCenter()
-        center.addObserver_selector_name_object_(
-            self, 'clipboardChanged:', 'com.apple.pasteboard.clipboardChanged', None)
-        
-        # 定时检查剪贴板
-        self.timer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(
-            CLIPBOARD_CHECK_INTERVAL, self, 'checkClipboard:', None, True)
-        
-        # 检查初始主题
-        self.checkTheme_(None)
-        # 定时检查主题变化
-        self.theme_timer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(
-            1.0, self, 'checkTheme:', None, True)
-        
-        return self
-    
-    def checkClipboard_(self, timer):
-        """检查剪贴板内容变化"""
-        pasteboard = NSPasteboard.generalPasteboard()
-        
-        # 检查文本内容
-        if content := pasteboard.stringForType_("public.utf8-plain-text"):
-            if content != self.last_content:
-                self.signals.clipboardChanged.emit("text", content.encode('utf-8'))
-                self.last_content = content
-            return
-        
-        # 检查图片内容
-        if image_data := pasteboard.dataForType_("public.tiff"):
-            self.signals.clipboardChanged.emit("image", bytes(image_data))
-            self.last_content = None
-            return
-        
-        # 其他类型暂不处理
-        self.last_content = None
-    
-    def checkTheme_(self, timer):
-        """检查系统主题变化"""
-        appearance = NSApp.effectiveAppearance()
-        is_dark = "dark" in appearance.name().lower()
-        if is_dark != self.current_theme_dark:
-            self.current_theme_dark = is_dark
-            self.signals.themeChanged.emit(is_dark)
-    
-    def clipboardChanged_(self, notification):
-        """剪贴板变化通知处理"""
-        self.checkClipboard_(None)
-
-# 注册Objective-C选择器
-ClipboardMonitor.clipboardChanged_ = objc.selector(
-    ClipboardMonitor.clipboardChanged_,
-    signature=b'v@:@'
-)
-ClipboardMonitor.checkClipboard_ = objc.selector(
-    ClipboardMonitor.checkClipboard_,
-    signature=b'v@:@'
-)
-ClipboardMonitor.checkTheme_ = objc.selector(
-    ClipboardMonitor.checkTheme_,
-    signature=b'v@:@'
-)
-
-NSTimer = objc.lookUpClass('NSTimer')
-
-class ClipboardItemWidget(QWidget):
-    """剪贴板历史项组件"""
-    def __init__(self, content_type, content, timestamp, copy_count=0, is_pinned=False, parent=None, main_window=None):
-        super().__init__(parent)
-        self.content_type = content_type
-        self.content = content
-        self.timestamp = timestamp
-        self.copy_count = copy_count
-        self.is_pinned = is_pinned
-        self.main_window = main_window
-        self.is_pressed = False
-        
-        self.setup_ui()
-        self.update_style()
-        
-    def setup_ui(self):
-        """设置UI组件"""
-        self.setFixedHeight(ITEM_HEIGHT)
-        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
-        
-        layout = QVBoxLayout(self)
-        layout.setContentsMargins(MARGIN, 5, MARGIN, 5)  # 统一左右边距
-        layout.setSpacing(5)
-        
-        # 顶部布局(时间和固定按钮)
-        top_layout = QHBoxLayout()
-        top_layout.setContentsMargins(0, 0, 0, 0)
-        top_layout.setSpacing(5)
-        
-        # 显示时间和复制次数
-        time_str = self.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-        count_str = f"复制 {self.copy_count} 次" if self.copy_count > 0 else "未复制"
-        self.time_label = QLabel(f"{time_str} | {count_str}")
-        self.time_label.setStyleSheet("color: gray; font-size: 11px;")
-        self.time_label.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
-        
-        self.pin_button = QPushButton()
-        self.pin_button.setFixedSize(20, 20)
-        self.pin_button.setFlat(True)
-        self.pin_button.setIconSize(QSize(16, 16))
-        self.update_pin_icon()
-        self.pin_button.clicked.connect(self.toggle_pin)
-        
-        top_layout.addWidget(self.time_label, stretch=1)
-        top_layout.addWidget(self.pin_button, Qt.AlignmentFlag.AlignRight)
-        
-        # 内容显示区域
-        self.content_display = QTextEdit()
-        self.content_display.setReadOnly(True)
-        self.content_display.setFrameShape(QFrame.Shape.NoFrame)
-        self.content_display.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.content_display.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.content_display.setWordWrapMode(QTextOption.WrapMode.WrapAtWordBoundaryOrAnywhere)
-        self.content_display.setLineWrapMode(QTextEdit.LineWrapMode.WidgetWidth)
-        
-        # 根据内容类型设置显示
-        if self.content_type == "text":
-            text = self.content.decode('utf-8') if isinstance(self.content, bytes) else str(self.content)
-            self.content_display.setPlainText(text)
-            self.content_display.setMaximumHeight(ITEM_HEIGHT - 30)
-        elif self.content_type == "image":
-            self.content_display.setPlainText("[图片]")
-            self.content_display.setMaximumHeight(ITEM_HEIGHT - 30)
-        
-        # 添加到主布局
-        layout.addLayout(top_layout)
-        layout.addWidget(self.content_display)
-        
-        # 设置背景和阴影效果
-        self.setAutoFillBackground(True)
-        self.setAttribute(Qt.WidgetAttribute.WA_StyledBackground, True)
-        
-        shadow = QGraphicsDropShadowEffect()
-        shadow.setBlurRadius(5)
-        shadow.setColor(QColor(0, 0, 0, 30))
-        shadow.setOffset(0, 1)
-        self.setGraphicsEffect(shadow)
-        
-        # 设置整个widget可点击
-        self.setCursor(Qt.CursorShape.PointingHandCursor)
-    
-    def mousePressEvent(self, event):
-        """鼠标按下事件处理"""
-        if event.button() == Qt.MouseButton.LeftButton:
-            self.is_pressed = True
-            self.update_style(pressed=True)
-            event.accept()
-    
-    def mouseReleaseEvent(self, event):
-        """鼠标释放事件处理"""
-        if self.is_pressed and event.button() == Qt.MouseButton.LeftButton:
-            self.is_pressed = False
-            self.update_style(pressed=False)
-            if not self.pin_button.underMouse():  # 如果点击的不是固定按钮
-                self.main_window.copy_to_clipboard(self)
-            event.accept()
-        else:
-            super().mouseReleaseEvent(event)
-    
-    def enterEvent(self, event):
-        """鼠标进入事件处理"""
-        self.update_style(hover=True)
-        super().enterEvent(event)
-    
-    def leaveEvent(self, event):
-        """鼠标离开事件处理"""
-        self.update_style(hover=False)
-        super().leaveEvent(event)
-    
-    def update_pin_icon(self):
-        """更新固定按钮图标"""
-        self.pin_button.setIcon(QIcon.fromTheme("pin" if self.is_pinned else "unpin"))
-    
-    def toggle_pin(self):
-        """切换固定状态"""
-        self.is_pinned = not self.is_pinned
-        self.update_pin_icon()
-        if self.main_window:
-            self.main_window.pin_status_changed(self, self.is_pinned)
-
-    def update_style(self, is_dark=None, hover=False, pressed=False):
-        """更新组件样式"""
-        if is_dark is None:
-            is_dark = self.main_window.current_theme_dark if self.main_window else False
-        
-        # 根据主题设置颜色
-        if is_dark:
-            bg_color = QColor(50, 50, 50)
-            border_color = QColor(70, 70, 70)
-            text_color = QColor(220, 220, 220)
-            hover_color = QColor(60, 60, 60)
-            pressed_color = QColor(70, 70, 70)
-        else:
-            bg_color = QColor(255, 255, 255)
-            border_color = QColor(230, 230, 230)
-            text_color = QColor(50, 50, 50)
-            hover_color = QColor(240, 240, 240)
-            pressed_color = QColor(230, 230, 230)
-        
-        # 根据状态确定背景色
-        current_bg = pressed_color if pressed else hover_color if hover else bg_color
-        
-        # 设置样式表
-        self.setStyleSheet(f"""
-            ClipboardItemWidget {{
-                background-color: {current_bg.name()};
-                border: 1px solid {border_color.name()};
-                border-radius: 6px;
-                padding: 3px;
-            }}
-            QTextEdit {{
-                background-color: transparent;
-                color: {text_color.name()};
-                font-size: 12px;
-                padding: 0;
-                margin: 0;
-            }}
-        """)
-
 class ClipboardHistoryWindow(QMainWindow):
     """剪贴板历史窗口"""
     def __init__(self):
         super().__init__()
-        self.clipboard_history = []
-        self.pinned_items = []
+        self.backend = create_backend()  # 系统剪贴板和主题
+        self.store = HistoryStore(parent=self)  # 历史记录引擎
+        self.ingest = IngestQueue(self.store, self)  # 剪贴板变化先进入队列，按批加入历史
+        self.thumbnails = ThumbnailCache(os.path.expanduser("~/.clipboard_thumbnails"), self.store.blob_store, self)
         self.is_first_run = True
         self.current_theme_dark = False
         self.opacity = DEFAULT_OPACITY / 100  # 初始透明度
-        self.sort_rule = 0  # 0=按修改时间(最新在前), 1=按修改时间(最旧在前), 2=按复制次数(最多在前)
+        self.sort_rule = 0  # 0=按修改时间(最旧在前), 1=按修改时间(最新在前), 2=按复制次数(最多在前), 3=按常用程度
         self.always_on_top = True  # 默认窗口置顶
+        self.history_limits = None  # 每种内容的 (最大项目数, 最大总字节数)，None 使用默认限制
+        self.max_age_days = None  # 历史项最长保存天数，None 表示不过期
+        self.eviction_policy = EVICT_LRU  # 超出限制时的淘汰策略
         
         self.set_initial_style()
         self.setup_ui()
         self.setup_menu_bar()
         self.setup_clipboard_monitor()
+        self.load_settings()  # 先读取排序规则，历史按显示顺序加载
         self.load_history()
-        self.load_settings()
     
         self.update_clear_button_visibility()
         self.update_style()
     
     def set_initial_style(self):
         """设置初始样式"""
-        appearance = NSApp.effectiveAppearance()
-        self.current_theme_dark = "dark" in appearance.name().lower()
+        self.current_theme_dark = self.backend.is_dark_theme()
         
         # 设置窗口背景色
         bg_color = QColor(45, 45, 45) if self.current_theme_dark else QColor(250, 250, 250)
@@ -463,6 +275,25 @@ class ClipboardHistoryWindow(QMainWindow):
         app_menu.addSeparator()
         app_menu.addAction(about_action)
         app_menu.addAction(quit_action)
+        
+        # 常用菜单：打开时列出常用程度最高的项目，点击即复制
+        self.frecent_menu = menubar.addMenu("常用")
+        self.frecent_menu.aboutToShow.connect(self.update_frecent_menu)
+    
+    def update_frecent_menu(self):
+        """刷新常用菜单(常用项目由 HistoryStore 增量维护，不需要排序全部历史)"""
+        self.frecent_menu.clear()
+        items = self.store.frecent_items(FRECENT_MENU_ITEMS)
+        if not items:
+            self.frecent_menu.addAction("暂无历史").setEnabled(False)
+            return
+        for item in items:
+            if item.content_type == "image":
+                title = "[图片]"
+            else:
+                title = " ".join(content_text(item.content)[:MENU_TITLE_CHARS * 4].split())[:MENU_TITLE_CHARS]
+            action = self.frecent_menu.addAction(title.replace("&", "&&"))
+            action.triggered.connect(lambda checked=False, item=item: self.copy_to_clipboard(item))
     
     def show_opacity_dialog(self):
         """显示透明度设置对话框"""
@@ -481,7 +312,6 @@ class ClipboardHistoryWindow(QMainWindow):
         
         if dialog.exec() == QDialog.DialogCode.Accepted:
             self.sort_rule = dialog.sort_combo.currentIndex()
-            self.sort_history()
             self.update_history_display()
             self.save_settings()
     
@@ -538,7 +368,12 @@ class ClipboardHistoryWindow(QMainWindow):
         
         self.search_box = QLineEdit()
         self.search_box.setPlaceholderText("搜索...")
-        self.search_box.textChanged.connect(self.filter_history)
+        # 输入停顿后再搜索
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DEBOUNCE_MS)
+        self.search_timer.timeout.connect(self.filter_history)
+        self.search_box.textChanged.connect(self.search_timer.start)
         
         self.clear_button = QPushButton("🧹清除")
         self.clear_button.setFixedSize(60, 28)
@@ -548,21 +383,32 @@ class ClipboardHistoryWindow(QMainWindow):
         search_clear_layout.addWidget(self.clear_button)
         layout.addLayout(search_clear_layout)
         
-        # 滚动区域
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
-        self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
-        
-        self.scroll_content = QWidget()
-        self.scroll_content.setObjectName("ScrollContent")  # 添加ID以便样式化
-        self.scroll_layout = QVBoxLayout(self.scroll_content)
-        self.scroll_layout.setContentsMargins(0, 0, 0, 0)  # 右侧留出滚动条空间
-        self.scroll_layout.setSpacing(8)
-        self.scroll_layout.addStretch(1)
-        
-        self.scroll_area.setWidget(self.scroll_content)
-        layout.addWidget(self.scroll_area)
+        # 历史列表(只绘制可见行)
+        self.history_model = HistoryListModel(self)
+        self.history_delegate = HistoryItemDelegate(self)
+        self.history_delegate.is_dark = self.current_theme_dark
+        self.history_delegate.thumbnails = self.thumbnails
+        self.history_delegate.itemClicked.connect(self.copy_to_clipboard)
+        self.history_delegate.pinClicked.connect(
+            lambda item: self.pin_status_changed(item, not item.is_pinned))
+        
+        self.history_view = QListView()
+        self.history_view.setModel(self.history_model)
+        self.history_view.setItemDelegate(self.history_delegate)
+        self.history_view.setUniformItemSizes(True)
+        self.history_view.setMouseTracking(True)
+        self.history_view.setFrameShape(QFrame.Shape.NoFrame)
+        self.history_view.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.history_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.history_view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.history_view.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.history_view.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAsNeeded)
+        self.history_view.viewport().setCursor(Qt.CursorShape.PointingHandCursor)
+        self.history_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+        self.history_view.customContextMenuRequested.connect(self.show_item_menu)
+        layout.addWidget(self.history_view)
+        # 缩略图在后台生成完成后重绘可见行
+        self.thumbnails.thumbnailReady.connect(lambda key: self.history_view.viewport().update())
         
         # 设置窗口大小
         self.resize(350, 500)
@@ -573,284 +419,220 @@ class ClipboardHistoryWindow(QMainWindow):
         path = os.path.expanduser("~/.clipboard_settings")
         if os.path.exists(path):
             try:
+                # 旧版 pickle 格式的设置在下面保存置顶状态时重写为当前格式
                 with open(path, 'rb') as f:
-                    settings = pickle.load(f)
+                    settings = decode_settings(f.read())
                     self.opacity = settings.get('opacity', DEFAULT_OPACITY / 100)
                     self.sort_rule = settings.get('sort_rule', 0)
                     self.always_on_top = settings.get('always_on_top', True)
+                    limits = settings.get('history_limits')
+                    self.history_limits = {content_type: tuple(limit) for content_type, limit in limits.items()} if limits else None
+                    self.max_age_days = settings.get('max_age_days')
+                    self.eviction_policy = settings.get('eviction_policy', EVICT_LRU)
                     
                     # 应用设置
                     self.setWindowOpacity(self.opacity)
                     self.always_on_top_action.setChecked(self.always_on_top)
                     self.toggle_always_on_top(self.always_on_top)
+                    self.store.configure(self.history_limits, self.max_age_days, self.eviction_policy)
+                    if self.history_model.sort_rule != self.sort_rule:
+                        self.update_history_display()
             except Exception as e:
                 print(f"加载设置失败: {e}")
     
     def save_settings(self):
         """保存设置"""
-        path = os.path.expanduser("~/.clipboard_settings")
-        try:
-            with open(path, 'wb') as f:
-                pickle.dump({
-                    'opacity': self.opacity,
-                    'sort_rule': self.sort_rule,
-                    'always_on_top': self.always_on_top
-                }, f)
-        except Exception as e:
-            print(f"保存设置失败: {e}")
+        # 由后台线程写入
+        self.store.save_settings(os.path.expanduser("~/.clipboard_settings"), {
+            'opacity': self.opacity,
+            'sort_rule': self.sort_rule,
+            'always_on_top': self.always_on_top,
+            'history_limits': self.history_limits,
+            'max_age_days': self.max_age_days,
+            'eviction_policy': self.eviction_policy
+        })
     
     def setup_clipboard_monitor(self):
         """设置剪贴板监视器"""
-        self.monitor = ClipboardMonitor.alloc().init()
-        if self.monitor:
-            self.monitor.signals.clipboardChanged.connect(self.add_to_clipboard_history)
-            self.monitor.signals.themeChanged.connect(self.handle_theme_change)
+        self.pasteboard_monitor = PasteboardMonitor(self.backend, self)
+        self.pasteboard_monitor.clipboardChanged.connect(self.ingest.submit)
+        self.ingest.eventsDropped.connect(
+            lambda count: self.show_message(f"剪贴板变化过快，已跳过 {count} 项", 1500))
+        self.pasteboard_monitor.start()
+        
+        # 系统的剪贴板变化通知和主题变化
+        self.system_signals = ClipboardSignals(self)
+        self.system_signals.pasteboardNotified.connect(self.pasteboard_monitor.check)
+        self.system_signals.themeChanged.connect(self.handle_theme_change)
+        self.backend.watch(self.system_signals)
     
     def handle_theme_change(self, is_dark):
         """处理主题变化"""
         if is_dark != self.current_theme_dark:
             self.current_theme_dark = is_dark
             self.update_style()
-            for widget in self.findChildren(ClipboardItemWidget):
-                widget.update_style(is_dark)
+            self.history_delegate.is_dark = is_dark
+            self.history_view.viewport().update()
     
     def load_history(self):
-        """加载历史记录"""
-        path = os.path.expanduser("~/.clipboard_history")
-        if os.path.exists(path):
-            try:
-                with open(path, 'rb') as f:
-                    history = pickle.load(f)
-                    # 现在每个历史项是 (content_type, content, timestamp, copy_count, is_pinned)
-                    self.clipboard_history = [item for item in history if not item[4]]  # 未固定的
-                    self.pinned_items = [item for item in history if item[4]]  # 固定的
-                    
-                    # 按当前排序规则排序
-                    self.sort_history()
-                    
-                    self.update_history_display()
-                
-                self.is_first_run = False
-            except Exception as e:
-                print(f"加载历史记录失败: {e}")
-                # 加载失败时初始化空历史
-                self.clipboard_history = []
-                self.pinned_items = []
-        else:
-            if self.is_first_run:
-                # 首次运行添加欢迎消息
-                self.add_to_clipboard_history("text", "欢迎使用剪贴板历史管理器")
-                self.add_to_clipboard_history("text", "点击项目将内容复制到剪贴板")
-                self.is_first_run = False
-        
-        # 确保显示更新
-        self.update_history_display()
+        """加载历史记录，之后历史的变化都通过 HistoryStore 的信号更新显示"""
+        self.store.itemAdded.connect(self.history_item_added)
+        self.store.itemRemoved.connect(self.history_item_removed)
+        self.store.itemUpdated.connect(self.history_item_updated)
+        self.store.historyReset.connect(self.update_history_display)
+        self.store.itemsAdded.connect(self.history_items_added)
+        self.store.itemsLoaded.connect(self.history_items_added)
+        self.store.historyLoaded.connect(lambda: self.thumbnails.sweep(self.store.blob_keys()))
+        self.store.contentLoaded.connect(self.content_loaded)
+        self.store.loadFailed.connect(self.content_load_failed)
+        # 退出前处理完接收队列，再写完剩余的变更
+        QApplication.instance().aboutToQuit.connect(self.ingest.flush)
+        QApplication.instance().aboutToQuit.connect(self.store.close)
+        QApplication.instance().aboutToQuit.connect(self.thumbnails.shutdown)
+        
+        # 后台加载，窗口不必等待读取完成
+        if self.store.load(self.sort_rule):
+            self.is_first_run = False
+        
+        if self.is_first_run:
+            # 首次运行添加欢迎消息
+            self.add_to_clipboard_history("text", "欢迎使用剪贴板历史管理器")
+            self.add_to_clipboard_history("text", "点击项目将内容复制到剪贴板")
+            self.is_first_run = False
+        
         self.update_clear_button_visibility()
     
-    def sort_history(self):
-        """对所有历史记录进行排序"""
-        # 合并固定和非固定项目
-        all_items = self.clipboard_history + self.pinned_items
-        
-        # 根据当前排序规则排序
-        if self.sort_rule == 0:  # 按修改时间(最新在前)
-            all_items.sort(key=lambda x: x[2], reverse=True)
-        elif self.sort_rule == 1:  # 按修改时间(最旧在前)
-            all_items.sort(key=lambda x: x[2], reverse=False)
-        elif self.sort_rule == 2:  # 按复制次数(最多在前)
-            all_items.sort(key=lambda x: x[3], reverse=False)
-        
-        # 重新分离固定和非固定项目
-        self.clipboard_history = [item for item in all_items if not item[4]]
-        self.pinned_items = [item for item in all_items if item[4]]
-    
-    def save_history(self):
-        """保存历史记录"""
-        path = os.path.expanduser("~/.clipboard_history")
-        try:
-            with open(path, 'wb') as f:
-                # 保存所有历史项，包括复制次数和固定状态
-                pickle.dump(self.clipboard_history + self.pinned_items, f)
-        except Exception as e:
-            print(f"保存历史记录失败: {e}")
-    
     def add_to_clipboard_history(self, content_type, content):
-        """
-        添加内容到剪贴板历史
-        优化点:
-        1. 避免重复内容
-        2. 更新现有项目的时间戳
-        3. 限制历史记录数量
-        """
-        # 如果内容为空，不添加
-        if not content:
-            return
-            
-        # 检查内容是否已存在
-        if self.content_exists(content_type, content):
-            return
-            
-        # 如果是文本内容且是字节类型，解码为字符串
-        if content_type == "text" and isinstance(content, bytes):
-            try:
-                content = content.decode('utf-8')
-            except UnicodeDecodeError:
-                # 如果解码失败，使用原始字节数据
-                pass
-        
-        # 更新现有项目的时间戳(如果存在且未固定)
-        for i, (item_type, item_content, _, copy_count, is_pinned) in enumerate(self.clipboard_history):
-            if self.compare_content(item_type, item_content, content_type, content) and not is_pinned:
-                self.clipboard_history[i] = (item_type, item_content, datetime.now(), copy_count, False)
-                self.sort_history()
-                self.update_history_display()
-                self.update_clear_button_visibility()
-                return
-        
-        # 添加新项目到历史记录开头，初始复制次数为0
-        self.clipboard_history.insert(0, (content_type, content, datetime.now(), 0, False))
-        
-        # 限制历史记录数量
-        if len(self.clipboard_history) > MAX_HISTORY_ITEMS:
-            # 保留所有固定项目
-            pinned = [item for item in self.clipboard_history if item[4]]
-            # 保留最新的非固定项目
-            non_pinned = [item for item in self.clipboard_history if not item[4]]
-            non_pinned = non_pinned[:MAX_HISTORY_ITEMS - len(pinned)]
-            # 合并固定和非固定项目
-            self.clipboard_history = pinned + non_pinned
-        
-        # 排序并更新显示
-        self.sort_history()
-        self.update_history_display()
+        """添加内容到剪贴板历史(判重和容量淘汰由 HistoryStore 完成)"""
+        self.store.add(content_type, content)
+    
+    def history_item_added(self, key, item):
+        """新增历史项：只插入对应的行"""
+        self.history_model.insert_item(key, item)
+        self.history_changed()
+    
+    def history_items_added(self, items):
+        """一批历史项(启动加载或批量接收)：只刷新一次显示"""
+        self.history_model.insert_items(items)
+        self.history_changed()
+    
+    def history_item_removed(self, key, item):
+        """删除历史项：只删除对应的行"""
+        self.history_model.remove_item(key, item)
+        if item.content_type == "image":  # 只有图片有缩略图
+            self.thumbnails.discard(key)
+        self.history_changed()
+    
+    def history_item_updated(self, key, item, state):
+        """更新历史项：只移动该项所在的行"""
+        self.history_model.update_item(key, item, state)
+        self.history_changed()
+    
+    def history_changed(self):
+        """历史变化后刷新搜索结果、计数和清除按钮"""
+        self.refresh_search()
+        self.update_count_label()
         self.update_clear_button_visibility()
-        self.save_history()
-    
-    def compare_content(self, type1, content1, type2, content2):
-        """比较两个内容是否相同"""
-        if type1 != type2:
-            return False
-            
-        if type1 == "text":
-            # 处理文本内容比较
-            text1 = content1.decode('utf-8') if isinstance(content1, bytes) else str(content1)
-            text2 = content2.decode('utf-8') if isinstance(content2, bytes) else str(content2)
-            return text1.strip() == text2.strip()
-        elif type1 == "image":
-            # 图片内容直接比较字节数据
-            return content1 == content2
-        return False
     
     def update_clear_button_visibility(self):
         """更新清除按钮可见性"""
-        total_count = len(self.clipboard_history) + len(self.pinned_items)
-        self.clear_button.setVisible(total_count > 0)
-    
-    def content_exists(self, content_type, content):
-        """检查内容是否已存在于历史记录中"""
-        for item in self.clipboard_history + self.pinned_items:
-            if self.compare_content(item[0], item[1], content_type, content):
-                return True
-        return False
+        self.clear_button.setVisible(len(self.store) > 0)
     
     def update_history_display(self):
         """更新历史记录显示"""
-        # 清除现有项(保留最后的拉伸项)
-        while self.scroll_layout.count() > 1:
-            item = self.scroll_layout.takeAt(0)
-            widget = item.widget()
-            if widget:
-                widget.deleteLater()
-        
-        # 先显示已固定的项目
-        for pinned_item in self.pinned_items:
-            item_type, content, timestamp, copy_count, _ = pinned_item
-            item_widget = ClipboardItemWidget(item_type, content, timestamp, copy_count, True, main_window=self)
-            self.scroll_layout.insertWidget(0, item_widget)
-        
-        # 然后显示未固定的项目
-        for item in self.clipboard_history:
-            item_type, content, timestamp, copy_count, is_pinned = item
-            if not is_pinned:
-                item_widget = ClipboardItemWidget(item_type, content, timestamp, copy_count, False, main_window=self)
-                self.scroll_layout.insertWidget(len(self.pinned_items), item_widget)
-        
-        # 更新计数标签
-        total_count = len(self.clipboard_history) + len(self.pinned_items)
-        pinned_count = len(self.pinned_items)
+        # 按当前排序规则重建列表(固定的项目在前)
+        self.history_model.reset(self.store.items, self.sort_rule)
+        self.filter_history()
+        self.update_count_label()
+        self.update_clear_button_visibility()
+    
+    def update_count_label(self):
+        """更新计数标签"""
+        total_count = len(self.store)
+        pinned_count = self.history_model.pinned_count()
         self.count_label.setText(f"{total_count} 项 | 钉 {pinned_count}")
     
-    def filter_history(self, text):
-        """过滤历史记录"""
-        text = text.lower()
-        for i in range(self.scroll_layout.count() - 1):
-            item = self.scroll_layout.itemAt(i)
-            if item.widget():
-                widget = item.widget()
-                if widget.content_type == "text":
-                    # 文本内容过滤
-                    content = widget.content.decode('utf-8').lower() if isinstance(widget.content, bytes) else str(widget.content).lower()
-                    widget.setVisible(text in content)
-                else:
-                    # 图片内容默认隐藏
-                    widget.setVisible(not text)
+    def filter_history(self):
+        """
+        过滤历史记录
+        通过搜索索引查找匹配的文本(以 ^ 开头时按前缀匹配，以 ~ 开头时模糊搜索)，图片内容在搜索时隐藏；
+        结果固定项目在前，其余按常用程度(复制次数和时间衰减)排序
+        type:/is:/date:/copies: 筛选条件由二级索引查询(例如 "type:image date:2024-05-07" 查看某天的图片)
+        """
+        text = self.search_box.text()
+        if not text:
+            if self.history_model.results is not None:
+                self.history_model.set_results(None)
+            return
+        self.history_model.set_results(self.store.search(text))
+    
+    def refresh_search(self):
+        """历史变化后刷新搜索结果(同样经过防抖)"""
+        if self.search_box.text():
+            self.search_timer.start()
     
-    def copy_to_clipboard(self, item_widget):
+    def copy_to_clipboard(self, item):
         """
         复制内容到系统剪贴板
+        图片和超长文本由后台线程从二进制存储读取，读取完成后再写入剪贴板
+        """
+        self.store.load_content(item, LOAD_COPY)
+    
+    def show_detail(self, item):
+        """在详情窗口中查看完整内容(读取方式与复制相同)"""
+        self.store.load_content(item, LOAD_DETAIL)
+    
+    def content_loaded(self, item, content, purpose):
+        """完整内容读取完成，按用途写入剪贴板或显示详情"""
+        if purpose == LOAD_DETAIL:
+            HistoryDetailDialog(item, content, self).exec()
+        else:
+            self.write_to_clipboard(item, content)
+    
+    def content_load_failed(self, item, error, purpose):
+        """完整内容读取失败"""
+        title = "读取失败" if purpose == LOAD_DETAIL else "复制失败"
+        self.show_error_message(title, f"{title}: {error}")
+    
+    def show_item_menu(self, pos):
+        """历史项的右键菜单"""
+        index = self.history_view.indexAt(pos)
+        if not index.isValid():
+            return
+        item = self.history_model.item_at(index.row())
+        
+        menu = QMenu(self)
+        copy_action = menu.addAction("复制")
+        copy_action.triggered.connect(lambda: self.copy_to_clipboard(item))
+        detail_action = menu.addAction("查看完整内容")
+        detail_action.triggered.connect(lambda: self.show_detail(item))
+        menu.addSeparator()
+        pin_action = menu.addAction("取消固定" if item.is_pinned else "固定")
+        pin_action.triggered.connect(lambda: self.pin_status_changed(item, not item.is_pinned))
+        menu.exec(self.history_view.viewport().mapToGlobal(pos))
+    
+    def write_to_clipboard(self, item, content):
+        """
+        把完整内容写入系统剪贴板
         并更新复制次数和最后修改时间
         """
         try:
-            content_type = item_widget.content_type
-            content = item_widget.content
-            
-            if content_type == "text":
-                # 确保内容是字符串类型
-                text = content.decode('utf-8') if isinstance(content, bytes) else str(content)
-                pyperclip.copy(text)
-                self.show_message("已复制到剪贴板", 1000)
-            elif content_type == "image":
-                # 处理图片内容
-                pasteboard = NSPasteboard.generalPasteboard()
-                pasteboard.clearContents()
-                ns_data = NSData.dataWithBytes_length_(content, len(content))
-                pasteboard.setData_forType_(ns_data, "public.tiff")
-                self.show_message("图片已复制到剪贴板", 1000)
+            content_type = item.content_type
+            self.backend.write(PASTEBOARD_TYPES[content_type], content)
+            self.pasteboard_monitor.skip_current()  # 写回的内容(图片可能是还原的 TIFF)不再加入历史
+            self.show_message("已复制到剪贴板" if content_type == "text" else "图片已复制到剪贴板", 1000)
             
             # 更新复制次数和最后修改时间
-            self.update_item_copy_count(item_widget)
+            self.update_item_copy_count(item)
             
         except Exception as e:
             error_msg = f"复制失败: {str(e)}"
             print(error_msg)
             self.show_error_message("复制失败", error_msg)
     
-    def update_item_copy_count(self, item_widget):
+    def update_item_copy_count(self, item):
         """更新项目的复制次数和最后修改时间"""
-        # 查找项目在历史记录中的位置
-        for i, (item_type, item_content, _, item_copy_count, is_pinned) in enumerate(self.clipboard_history):
-            if (item_type == item_widget.content_type and 
-                self.compare_content(item_type, item_content, item_widget.content_type, item_widget.content) and not is_pinned):
-                # 更新复制次数和时间戳
-                self.clipboard_history[i] = (
-                    item_type, item_content, datetime.now(), item_copy_count + 1, False
-                )
-                break
-        
-        # 查找项目在固定列表中的位置
-        for i, (item_type, item_content, _, item_copy_count, is_pinned) in enumerate(self.pinned_items):
-            if (item_type == item_widget.content_type and 
-                self.compare_content(item_type, item_content, item_widget.content_type, item_widget.content) and is_pinned):
-                # 更新复制次数和时间戳
-                self.pinned_items[i] = (
-                    item_type, item_content, datetime.now(), item_copy_count + 1, True
-                )
-                break
-        
-        # 重新排序并更新显示
-        self.sort_history()
-        self.update_history_display()
-        self.save_history()
+        self.store.touch(item.key)
     
     def show_message(self, message, timeout=0):
         """显示临时消息"""
@@ -885,44 +667,9 @@ class ClipboardHistoryWindow(QMainWindow):
         msg.setStandardButtons(QMessageBox.StandardButton.Ok)
         msg.exec()
     
-    def pin_status_changed(self, widget, is_pinned):
+    def pin_status_changed(self, item, is_pinned):
         """处理固定状态变化"""
-        content_type = widget.content_type
-        content = widget.content
-        timestamp = datetime.now()  # 更新为当前时间
-        copy_count = widget.copy_count
-        
-        # 查找并更新历史记录中的项目
-        for i, (item_type, item_content, _, item_copy_count, _) in enumerate(self.clipboard_history):
-            if self.compare_content(item_type, item_content, content_type, content) and not self.is_item_pinned_at_index(i):
-                self.clipboard_history[i] = (item_type, item_content, timestamp, item_copy_count, is_pinned)
-                break
-        
-        # 更新固定项目列表
-        if is_pinned:
-            # 添加到固定列表
-            self.pinned_items.append((content_type, content, timestamp, copy_count, True))
-            # 从历史记录中移除
-            self.clipboard_history = [item for item in self.clipboard_history 
-                                    if not self.compare_content(item[0], item[1], content_type, content)]
-        else:
-            # 从固定列表中移除
-            self.pinned_items = [item for item in self.pinned_items 
-                               if not self.compare_content(item[0], item[1], content_type, content)]
-            # 添加到历史记录开头
-            self.clipboard_history.insert(0, (content_type, content, timestamp, copy_count, False))
-        
-        # 重新排序并更新显示
-        self.sort_history()
-        self.update_history_display()
-        self.update_clear_button_visibility()
-        self.save_history()
-    
-    def is_item_pinned_at_index(self, index):
-        """检查指定索引的项目是否已固定"""
-        if 0 <= index < len(self.clipboard_history):
-            return self.clipboard_history[index][4]
-        return False
+        self.store.set_pinned(item.key, is_pinned)
     
     def clear_clipboard_history(self):
         """清除剪贴板历史（保留被钉住的项目）"""
@@ -935,13 +682,10 @@ class ClipboardHistoryWindow(QMainWindow):
         )
         
         if reply == QMessageBox.StandardButton.Yes:
-            # 只清除未被钉住的项目
-            self.clipboard_history = [item for item in self.clipboard_history if item[4]]  # 只保留固定项目
-            
-            # 更新显示
-            self.update_history_display()
-            self.update_clear_button_visibility()
-            self.save_history()
+            # 只清除未被钉住的项目，显示通过 historyReset 整体更新
+            for key, item in self.store.clear_unpinned():
+                if item.content_type == "image":
+                    self.thumbnails.discard(key)
             
             # 显示清除完成提示
             self.show_message("已清除未被固定的历史记录", 2000)
@@ -966,8 +710,9 @@ class ClipboardHistoryWindow(QMainWindow):
                 padding: 8px;
             }}
             
-            QScrollArea {{
+            QListView {{
                 border: none;
+                background: transparent;
             }}
             
             QScrollBar:vertical {{
@@ -1032,6 +777,14 @@ if __name__ == "__main__":
     app.setApplicationVersion("1.0")
     app.setOrganizationName("ClipboardManager")
     
+    # 收到终止信号时正常退出，退出前写完尚未写入的历史变更；
+    # Python 的信号处理函数只在解释器运行时执行，因此用定时器定期把控制权交回解释器
+    signal.signal(signal.SIGTERM, lambda *args: app.quit())
+    signal.signal(signal.SIGINT, lambda *args: app.quit())
+    signal_timer = QTimer()
+    signal_timer.timeout.connect(lambda: None)
+    signal_timer.start(500)
+    
     window = ClipboardHistoryWindow()
     window.show()
     sys.exit(app.exec())
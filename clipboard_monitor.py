@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板变化监视
+1. 每次检查先读取剪贴板的变化计数，计数不变时不读取任何内容
+2. 剪贴板长时间不变时逐步拉长检查间隔，有变化后立即恢复最短间隔
+3. 复制回剪贴板时本程序自己写入的变化由 skip_current 跳过，不会再次加入历史
+4. 系统剪贴板通过 ClipboardBackend 接口访问，MemoryBackend 可以在没有 macOS 的环境中驱动监视器
+"""
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+from clipboard_backend import TYPE_TEXT, TYPE_TIFF
+
+CHECK_INTERVAL_MIN_MS = 250  # 最短检查间隔(毫秒)
+CHECK_INTERVAL_MAX_MS = 2000  # 空闲时的最长检查间隔(毫秒)
+CHECK_BACKOFF = 1.5  # 每次检查无变化时间隔放大的倍数
+
+
+class PasteboardMonitor(QObject):
+    """
+    按变化计数检查剪贴板
+    只在计数变化时读取内容，每次变化最多发出一次 clipboardChanged
+    """
+    clipboardChanged = pyqtSignal(str, object)  # 内容类型, 内容(文本为 str，图片为 bytes)
+
+    def __init__(self, backend, parent=None):
+        super().__init__(parent)
+        self.backend = backend
+        self.last_count = None  # 上次读取内容时的变化计数，None 表示尚未读取
+        self.interval = CHECK_INTERVAL_MIN_MS
+        self.running = False
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.check)
+
+    def start(self):
+        """开始定时检查"""
+        self.running = True
+        self.interval = CHECK_INTERVAL_MIN_MS
+        self.timer.start(self.interval)
+
+    def stop(self):
+        """停止定时检查"""
+        self.running = False
+        self.timer.stop()
+
+    def check(self):
+        """检查一次剪贴板(收到系统的剪贴板变化通知时也可以直接调用)"""
+        count = self.backend.change_count()
+        if count == self.last_count:
+            # 无变化时逐步放慢检查
+            self.interval = min(int(self.interval * CHECK_BACKOFF), CHECK_INTERVAL_MAX_MS)
+        else:
+            self.last_count = count
+            self.interval = CHECK_INTERVAL_MIN_MS
+            self.read()
+        if self.running:
+            self.timer.start(self.interval)
+
+    def skip_current(self):
+        """当前剪贴板内容是本程序写入的，不作为新的变化读取(复制回剪贴板后调用)"""
+        self.last_count = self.backend.change_count()
+
+    def read(self):
+        """读取剪贴板内容：先看类型列表，优先文本，其次图片，其他类型暂不处理"""
+        types = self.backend.types()
+        if TYPE_TEXT in types and (text := self.backend.read(TYPE_TEXT)):
+            self.clipboardChanged.emit("text", text)  # 文本原样传给 HistoryStore，不再编码后再解码
+        elif TYPE_TIFF in types and (image := self.backend.read(TYPE_TIFF)):
+            self.clipboardChanged.emit("image", bytes(image))
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板历史的容量限制和淘汰策略
+1. 文本和图片分别限制项目数量和总字节数，另可设置最长保存天数
+2. 固定项目计入容量但不会被淘汰
+3. 未固定项目按淘汰顺序保存在有序索引中，新增/更新/淘汰都是 O(log n)，不需要重建列表
+"""
+
+from history_index import OrderedIndex
+from history_item import now_timestamp
+from blob_store import BlobRef
+
+EVICT_LRU = 'lru'  # 最久未使用(时间戳最旧)的先淘汰
+EVICT_LFU = 'lfu'  # 复制次数最少的先淘汰，次数相同时较旧的先淘汰
+
+# 每种内容的 (最大项目数, 最大总字节数)，None 表示不限制
+DEFAULT_LIMITS = {
+    "text": (1000000, 512 * 1024 * 1024),
+    "image": (5000, 2 * 1024 * 1024 * 1024),
+}
+
+
+def item_size(item):
+    """历史项内容的字节数(存入二进制存储的内容按原始大小计)"""
+    content = item.content
+    if isinstance(content, BlobRef):
+        return content.size
+    if isinstance(content, str):
+        return len(content) if content.isascii() else len(content.encode('utf-8', errors='surrogatepass'))
+    return len(content)
+
+
+class HistoryEvictor:
+    """
+    跟踪每种内容的数量和总字节数，超出限制时给出应淘汰的内容键
+    调用方负责在历史项新增、更新和删除时同步调用 add/update/remove
+    """
+    def __init__(self, limits=None, max_age_days=None, policy=EVICT_LRU):
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}  # 未给出的内容类型使用默认限制
+        self.max_age_days = max_age_days
+        self.policy = policy
+        self.entries = {}  # 内容键 -> (内容类型, 字节数, 淘汰顺序键, 时间顺序键)，固定项目的两个顺序键为 None
+        self.counts = {}  # 内容类型 -> 项目数
+        self.sizes = {}  # 内容类型 -> 总字节数
+        self.candidates = {}  # 内容类型 -> 未固定项目的淘汰顺序索引
+        self.by_age = OrderedIndex()  # 全部未固定项目按时间排序，用于过期淘汰
+
+    def configure(self, limits=None, max_age_days=None, policy=EVICT_LRU, items=None):
+        """修改限制(只需给出要修改的内容类型)和淘汰策略，按 items({内容键: 历史项})重建索引"""
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self.max_age_days = max_age_days
+        self.policy = policy
+        self.reset(items or {})
+
+    def reset(self, items):
+        """按全部历史项 {内容键: 历史项} 重建"""
+        self.entries = {}
+        self.counts = {}
+        self.sizes = {}
+        candidates = {}
+        by_age = []
+        for key, item in items.items():
+            entry = self._entry(key, item, item_size(item))
+            self._count(entry, 1)
+            if entry[2] is not None:
+                candidates.setdefault(entry[0], []).append(entry[2])
+                by_age.append(entry[3])
+        self.candidates = {content_type: OrderedIndex(keys) for content_type, keys in candidates.items()}
+        self.by_age = OrderedIndex(by_age)
+
+    def _entry(self, key, item, size):
+        """计算历史项的跟踪记录并保存"""
+        content_type = item.content_type
+        if item.is_pinned:
+            entry = (content_type, size, None, None)
+        else:
+            ts = item.timestamp
+            if self.policy == EVICT_LFU:
+                order = (item.copy_count, ts, key)
+            else:
+                order = (ts, key)
+            entry = (content_type, size, order, (ts, key))
+        self.entries[key] = entry
+        return entry
+
+    def _count(self, entry, sign):
+        """更新某种内容的数量和总字节数"""
+        content_type = entry[0]
+        self.counts[content_type] = self.counts.get(content_type, 0) + sign
+        self.sizes[content_type] = self.sizes.get(content_type, 0) + sign * entry[1]
+
+    def add(self, key, item, size=None):
+        """新增历史项，size 为内容的字节数(文本已有 UTF-8 编码时直接传入)，省略时由 item_size 计算"""
+        self.remove(key)
+        entry = self._entry(key, item, item_size(item) if size is None else size)
+        self._count(entry, 1)
+        if entry[2] is not None:
+            self.candidates.setdefault(entry[0], OrderedIndex()).insert(entry[2])
+            self.by_age.insert(entry[3])
+
+    def update(self, key, item):
+        """历史项的时间戳、复制次数、固定状态或内容引用变化后更新"""
+        old = self.entries.get(key)
+        if old is None:
+            self.add(key, item)
+            return
+        if old[2] is not None:
+            self.candidates[old[0]].remove(old[2])
+            self.by_age.remove(old[3])
+        entry = self._entry(key, item, old[1])  # 内容不变，沿用已算好的字节数
+        if entry[2] is not None:
+            self.candidates.setdefault(entry[0], OrderedIndex()).insert(entry[2])
+            self.by_age.insert(entry[3])
+
+    def remove(self, key):
+        """删除历史项"""
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self._count(entry, -1)
+        if entry[2] is not None:
+            self.candidates[entry[0]].remove(entry[2])
+            self.by_age.remove(entry[3])
+
+    def unpinned_count(self):
+        """未固定项目的数量"""
+        return len(self.by_age)
+
+    def _over_limit(self, content_type):
+        """某种内容是否超出数量或字节数限制"""
+        max_items, max_bytes = self.limits.get(content_type, (None, None))
+        return ((max_items is not None and self.counts.get(content_type, 0) > max_items)
+                or (max_bytes is not None and self.sizes.get(content_type, 0) > max_bytes))
+
+    def evict(self, now=None):
+        """
+        淘汰过期和超出限制的未固定项目，返回被淘汰的内容键(已从跟踪中删除)
+        每淘汰一项只需从索引头部取出一个元素；now 为整数微秒时间戳，省略时为当前时间
+        """
+        evicted = []
+        if self.max_age_days:
+            cutoff = (now or now_timestamp()) - self.max_age_days * 86400 * 1000000
+            while self.by_age and self.by_age[0][0] < cutoff:
+                key = self.by_age[0][-1]
+                self.remove(key)
+                evicted.append(key)
+
+        for content_type, candidates in self.candidates.items():
+            while candidates and self._over_limit(content_type):
+                key = candidates[0][-1]
+                self.remove(key)
+                evicted.append(key)
+        return evicted
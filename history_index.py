@@ -0,0 +1,735 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板历史的有序索引
+1. OrderedIndex 分桶有序列表，插入/删除/定位/按位置访问均为 O(log n)(摊还)
+2. sort_key 把历史项按排序规则映射为显示顺序的键(固定项目在前)
+3. TrigramIndex 文本开头部分的三元组倒排索引，用于子串和前缀搜索，倒排表用 array 紧凑保存
+4. AttributeIndex 按内容类型、固定状态、时间和复制次数的二级索引，条件查询和分页不扫描全部历史
+5. frecency 常用程度(复制次数加时间衰减)的排序值，不随当前时间变化；TopK 增量维护常用程度最高的若干项
+6. FuzzyIndex 模糊搜索的文本列，按块拼接小写文本，用字符位图整块筛选候选，再用编译好的正则表达式打分
+"""
+
+import re
+import math
+import heapq
+from array import array
+from bisect import bisect_left, insort
+from itertools import islice, accumulate
+from history_item import FLAG_IMAGE, FLAG_PINNED
+
+# 每个桶的目标大小，超过两倍时分裂
+BUCKET_SIZE = 512
+INDEX_TEXT_CHARS = 4 * 1024  # 子串搜索只索引和比较每条文本开头的字符数
+DAY_MICROSECONDS = 86400 * 1000000  # 一天的微秒数(时间戳按本地时间保存，整除即为日期)
+FRECENCY_HALF_LIFE = 7 * DAY_MICROSECONDS  # 常用程度中时间衰减的半衰期(微秒)
+FUZZY_TEXT_CHARS = 256  # 模糊搜索只比较每条文本开头的字符数
+FUZZY_BLOCK_SIZE = 4096  # 模糊搜索文本列每块的文本数
+FUZZY_TYPO_MIN = 4  # 查询至少这么长时，结果不足才允许一个多余或打错的字符
+FUZZY_TYPO_RESULTS = 20  # 命中少于此数(约一屏)时才查找打错字符的匹配
+
+
+def sort_key(sort_rule, key, item, state=None):
+    """
+    计算历史项在当前排序规则下的显示顺序键
+    键的最后两项是内容键和历史项本身，内容键保证唯一，历史项不会参与比较
+    state 为历史项修改前的 (时间戳, 复制次数, 是否固定)，用于定位修改前的位置；省略时使用当前值
+    """
+    ts, copy_count, is_pinned = state or item.state()
+    group = 0 if is_pinned else 1  # 固定项目在前
+    if sort_rule == 0:  # 按修改时间(最旧在前)
+        return (group, ts, key, item)
+    if sort_rule == 1:  # 按修改时间(最新在前)
+        return (group, -ts, key, item)
+    if sort_rule == 2:  # 按复制次数(最多在前)，次数相同时较新的在前
+        return (group, -copy_count, -ts, key, item)
+    # 按常用程度(最常用在前)
+    return (group, -frecency(ts, copy_count), key, item)
+
+
+
+def frecency(timestamp, copy_count):
+    """
+    常用程度的排序值：(1 + 复制次数) * 0.5 ** (距今时间 / 半衰期) 取以 2 为底的对数后去掉当前时间一项
+    时间衰减对所有历史项同时作用，去掉后排序不变，因此排序值只在历史项修改时变化，可以放进有序索引增量维护
+    """
+    return math.log2(1 + copy_count) + timestamp / FRECENCY_HALF_LIFE
+
+
+class OrderedIndex:
+    """
+    有序索引
+    元素按升序分布在若干桶中，桶长度的前缀和用树状数组维护，
+    因此既能按键二分查找，也能在 O(log n) 内求出元素的位置或按位置取元素
+    """
+    def __init__(self, keys=()):
+        keys = sorted(keys)
+        self._lists = [keys[i:i + BUCKET_SIZE] for i in range(0, len(keys), BUCKET_SIZE)]
+        self._maxes = [bucket[-1] for bucket in self._lists]
+        self._len = len(keys)
+        self._build_tree()
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for bucket in self._lists:
+            yield from bucket
+
+    def __getitem__(self, pos):
+        if pos < 0:
+            pos += self._len
+        if not 0 <= pos < self._len:
+            raise IndexError("OrderedIndex 下标越界")
+        bucket, offset = self._locate(pos)
+        return self._lists[bucket][offset]
+
+    def _build_tree(self):
+        """根据桶长度重建树状数组"""
+        tree = [len(bucket) for bucket in self._lists]
+        for i in range(len(tree)):
+            j = i | (i + 1)
+            if j < len(tree):
+                tree[j] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, bucket, delta):
+        """调整某个桶的长度"""
+        tree = self._tree
+        while bucket < len(tree):
+            tree[bucket] += delta
+            bucket |= bucket + 1
+
+    def _prefix(self, bucket):
+        """前 bucket 个桶的元素总数"""
+        total = 0
+        while bucket > 0:
+            total += self._tree[bucket - 1]
+            bucket &= bucket - 1
+        return total
+
+    def _locate(self, pos):
+        """把全局位置转换为 (桶下标, 桶内偏移)"""
+        tree = self._tree
+        bucket = 0
+        step = 1 << len(tree).bit_length()
+        while step:
+            nxt = bucket + step
+            if nxt <= len(tree) and tree[nxt - 1] <= pos:
+                bucket = nxt
+                pos -= tree[nxt - 1]
+            step >>= 1
+        return bucket, pos
+
+    def bisect_left(self, key):
+        """第一个不小于 key 的元素位置"""
+        bucket = bisect_left(self._maxes, key)
+        if bucket == len(self._maxes):
+            return self._len
+        return self._prefix(bucket) + bisect_left(self._lists[bucket], key)
+
+    def irange(self, start, stop, reverse=False):
+        """按位置遍历 [start, stop) 的元素(reverse=True 时从后向前)，只定位一次，之后逐桶顺序读取"""
+        start, stop = max(start, 0), min(stop, self._len)
+        remaining = stop - start
+        if remaining <= 0:
+            return
+        if reverse:
+            bucket, offset = self._locate(stop - 1)
+            while remaining > 0:
+                take = min(offset + 1, remaining)
+                yield from reversed(self._lists[bucket][offset + 1 - take:offset + 1])
+                remaining -= take
+                bucket -= 1
+                offset = len(self._lists[bucket]) - 1
+        else:
+            bucket, offset = self._locate(start)
+            while remaining > 0:
+                chunk = self._lists[bucket][offset:offset + remaining]
+                yield from chunk
+                remaining -= len(chunk)
+                bucket += 1
+                offset = 0
+
+    def insert(self, key):
+        """插入元素，返回插入位置"""
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            self._len = 1
+            self._build_tree()
+            return 0
+
+        bucket = bisect_left(self._maxes, key)
+        if bucket == len(self._maxes):
+            bucket -= 1
+            self._lists[bucket].append(key)
+            self._maxes[bucket] = key
+            offset = len(self._lists[bucket]) - 1
+        else:
+            offset = bisect_left(self._lists[bucket], key)
+            self._lists[bucket].insert(offset, key)
+        pos = self._prefix(bucket) + offset
+        self._len += 1
+
+        # 桶过大时分裂
+        items = self._lists[bucket]
+        if len(items) > 2 * BUCKET_SIZE:
+            tail = items[BUCKET_SIZE:]
+            del items[BUCKET_SIZE:]
+            self._maxes[bucket] = items[-1]
+            self._lists.insert(bucket + 1, tail)
+            self._maxes.insert(bucket + 1, tail[-1])
+            self._build_tree()
+        else:
+            self._tree_add(bucket, 1)
+        return pos
+
+    def _find(self, key):
+        """查找元素所在的 (桶下标, 桶内偏移)，不存在时抛出 ValueError"""
+        bucket = bisect_left(self._maxes, key)
+        if bucket < len(self._maxes):
+            offset = bisect_left(self._lists[bucket], key)
+            if self._lists[bucket][offset] == key:
+                return bucket, offset
+        raise ValueError("元素不在索引中")
+
+    def index(self, key):
+        """元素的位置"""
+        bucket, offset = self._find(key)
+        return self._prefix(bucket) + offset
+
+    def remove(self, key):
+        """删除元素，返回删除前的位置"""
+        bucket, offset = self._find(key)
+        pos = self._prefix(bucket) + offset
+        items = self._lists[bucket]
+        del items[offset]
+        self._len -= 1
+        if items:
+            self._maxes[bucket] = items[-1]
+            self._tree_add(bucket, -1)
+        else:
+            del self._lists[bucket]
+            del self._maxes[bucket]
+            self._build_tree()
+        return pos
+
+
+class TrigramIndex:
+    """
+    文本历史项的三元组倒排索引，只索引每条文本开头 INDEX_TEXT_CHARS 个字符(搜索也只比较这一部分)
+    倒排表是按文档号递增的 array('i')，只出现在一条文本中的三元组直接保存文档号；文档号只增不减，新增只需追加。
+    删除时累计各倒排表中已删除的文档数，超过四分之一时再过滤该倒排表
+    docs 保存调用方传入的文本对象本身而不是小写副本：长度不小于3的查询先求各倒排表的交集，再校验候选项；
+    更短的查询直接逐条校验。开头部分已全是小写的文本(cased 中记为0)校验时直接在原文中查找
+    """
+    def __init__(self):
+        self.postings = {}  # 三元组 -> 文档号或 array('i')
+        self.dead = {}  # 三元组 -> 倒排表中已删除的文档数
+        self.docs = {}  # 文档号 -> (内容键, 文本)
+        self.doc_ids = {}  # 内容键 -> 文档号
+        self.cased = bytearray()  # 文档号 -> 开头部分是否需要转为小写再比较
+        self.next_id = 0
+
+    def __len__(self):
+        return len(self.docs)
+
+    @staticmethod
+    def _grams(text):
+        """文本中所有不重复的三元组"""
+        return {text[i:i + 3] for i in range(len(text) - 2)}
+
+    def add(self, key, text):
+        """索引一条文本(只引用 text，不复制)"""
+        if key in self.doc_ids:
+            self.remove(key)
+        doc = self.next_id
+        self.next_id += 1
+        self.doc_ids[key] = doc
+        self.docs[doc] = (key, text)
+        text = text[:INDEX_TEXT_CHARS]
+        lowered = text.lower()
+        self.cased.append(lowered != text)
+        postings = self.postings
+        for gram in self._grams(lowered):
+            posting = postings.get(gram)
+            if posting is None:
+                postings[gram] = doc
+            elif type(posting) is int:
+                postings[gram] = array('i', (posting, doc))
+            else:
+                posting.append(doc)
+
+    def remove(self, key):
+        """从索引中删除一条文本"""
+        doc = self.doc_ids.pop(key, None)
+        if doc is None:
+            return
+        _, text = self.docs.pop(doc)
+        postings, dead = self.postings, self.dead
+        for gram in self._grams(_search_text(text)):
+            posting = postings.get(gram)
+            if posting is None:
+                continue
+            if type(posting) is int:
+                if posting == doc:
+                    del postings[gram]
+                continue
+            count = dead.get(gram, 0) + 1
+            if count * 4 <= len(posting):
+                dead[gram] = count
+                continue
+            # 已删除的超过四分之一，过滤整个倒排表
+            dead.pop(gram, None)
+            live = array('i', filter(self.docs.__contains__, posting))
+            if not live:
+                del postings[gram]
+            else:
+                postings[gram] = live[0] if len(live) == 1 else live
+
+    def clear(self):
+        """清空索引"""
+        self.postings.clear()
+        self.dead.clear()
+        self.docs.clear()
+        self.doc_ids.clear()
+        self.cased.clear()
+        self.next_id = 0
+
+    def search(self, query, prefix=False):
+        """返回开头部分包含 query(prefix=True 时以 query 开头)的文本的内容键"""
+        query = query.lower()
+        docs = self.docs
+        if len(query) < 3:
+            candidates = docs
+        else:
+            postings = []
+            for gram in self._grams(query):
+                posting = self.postings.get(gram)
+                if posting is None:
+                    return []
+                postings.append((posting,) if type(posting) is int else posting)
+            postings.sort(key=len)
+            candidates = set(postings[0])
+            for posting in postings[1:]:
+                if not candidates:
+                    break
+                if len(candidates) * 16 < len(posting):
+                    # 候选项很少时在有序倒排表中二分查找
+                    candidates = {doc for doc in candidates if _sorted_contains(posting, doc)}
+                else:
+                    candidates.intersection_update(posting)
+
+        cased = self.cased
+        results = []
+        for doc in candidates:
+            entry = docs.get(doc)
+            if entry is None:
+                continue
+            key, text = entry
+            if cased[doc]:
+                text = _search_text(text)
+            if text.startswith(query, 0, INDEX_TEXT_CHARS) if prefix else text.find(query, 0, INDEX_TEXT_CHARS) >= 0:
+                results.append(key)
+        return results
+
+
+def _search_text(text):
+    """子串搜索比较的文本：开头 INDEX_TEXT_CHARS 个字符转为小写"""
+    return text[:INDEX_TEXT_CHARS].lower()
+
+
+def _sorted_contains(posting, doc):
+    """有序倒排表中是否有 doc"""
+    i = bisect_left(posting, doc)
+    return i < len(posting) and posting[i] == doc
+
+
+def _group(item, is_pinned=None):
+    """历史项所在的分组(内容类型和固定状态的标志位)，is_pinned 省略时使用当前值"""
+    if is_pinned is None:
+        is_pinned = item.is_pinned
+    return (item.flags & FLAG_IMAGE) | (FLAG_PINNED if is_pinned else 0)
+
+
+class AttributeIndex:
+    """
+    历史项的二级索引
+    按 (内容类型, 是否固定) 分为至多四组，每组一个按 (时间戳, 内容键) 排序和一个按 (复制次数, 时间戳, 内容键)
+    排序的 OrderedIndex；条件查询先在各组内二分定位，再合并各组的有序片段，查询和分页为 O(log n + k)
+    调用方负责在历史项新增、更新和删除时同步调用 add/update/remove，修改前的状态由调用方提供，索引不另存副本
+    """
+    def __init__(self):
+        self.by_time = {}  # 分组 -> OrderedIndex[(时间戳, 内容键)]
+        self.by_copies = {}  # 分组 -> OrderedIndex[(复制次数, 时间戳, 内容键)]
+
+    def __len__(self):
+        return sum(len(index) for index in self.by_time.values())
+
+    def reset(self, items):
+        """按全部历史项 {内容键: 历史项} 重建"""
+        by_time, by_copies = {}, {}
+        for key, item in items.items():
+            group = _group(item)
+            by_time.setdefault(group, []).append((item.timestamp, key))
+            by_copies.setdefault(group, []).append((item.copy_count, item.timestamp, key))
+        self.by_time = {group: OrderedIndex(keys) for group, keys in by_time.items()}
+        self.by_copies = {group: OrderedIndex(keys) for group, keys in by_copies.items()}
+
+    def add(self, key, item):
+        """新增历史项"""
+        group = _group(item)
+        if group not in self.by_time:
+            self.by_time[group] = OrderedIndex()
+            self.by_copies[group] = OrderedIndex()
+        self.by_time[group].insert((item.timestamp, key))
+        self.by_copies[group].insert((item.copy_count, item.timestamp, key))
+
+    def remove(self, key, item, state=None):
+        """删除历史项，state 为历史项修改前的 (时间戳, 复制次数, 是否固定)，省略时使用当前值"""
+        ts, copy_count, is_pinned = state or item.state()
+        group = _group(item, is_pinned)
+        self.by_time[group].remove((ts, key))
+        self.by_copies[group].remove((copy_count, ts, key))
+
+    def update(self, key, item, state):
+        """历史项的时间戳、复制次数或固定状态已原地修改(state 为修改前的值)"""
+        self.remove(key, item, state)
+        self.add(key, item)
+
+    def _groups(self, content_type, pinned):
+        """满足内容类型和固定状态条件(None 表示不限)的分组"""
+        groups = []
+        for group in self.by_time:
+            if content_type is not None and bool(group & FLAG_IMAGE) != (content_type == "image"):
+                continue
+            if pinned is not None and bool(group & FLAG_PINNED) != pinned:
+                continue
+            groups.append(group)
+        return groups
+
+    @staticmethod
+    def _time_range(index, start, end):
+        """时间范围 [start, end) 在按时间排序的索引中的位置范围，None 表示不限"""
+        lo = 0 if start is None else index.bisect_left((start,))
+        hi = len(index) if end is None else index.bisect_left((end,))
+        return lo, hi
+
+    def count(self, content_type=None, pinned=None, start=None, end=None):
+        """满足条件的项目数，O(log n)"""
+        total = 0
+        for group in self._groups(content_type, pinned):
+            lo, hi = self._time_range(self.by_time[group], start, end)
+            total += max(hi - lo, 0)
+        return total
+
+    def find(self, content_type=None, pinned=None, start=None, end=None,
+             newest_first=True, after=None, limit=None, predicate=None):
+        """
+        按时间顺序返回满足条件的内容键
+        时间范围为 [start, end)(整数微秒)；after 为上一页最后一项的 (时间戳, 内容键)，返回其后的一页；
+        predicate(内容键) 为索引之外的附加条件，逐项检查
+        """
+        parts = []
+        for group in self._groups(content_type, pinned):
+            index = self.by_time[group]
+            lo, hi = self._time_range(index, start, end)
+            if after is not None:
+                if newest_first:
+                    hi = min(hi, index.bisect_left(after))
+                else:
+                    lo = max(lo, index.bisect_left((after[0], after[1] + b'\0')))  # 严格大于 after
+            parts.append(index.irange(lo, hi, reverse=newest_first))
+        keys = (key for _, key in heapq.merge(*parts, reverse=newest_first))
+        if predicate is not None:
+            keys = filter(predicate, keys)
+        return list(islice(keys, limit))
+
+    def most_copied(self, content_type=None, pinned=None, min_copies=0, limit=None):
+        """复制次数不少于 min_copies 的内容键，复制次数多的在前(次数相同时较新的在前)"""
+        parts = []
+        for group in self._groups(content_type, pinned):
+            index = self.by_copies[group]
+            parts.append(index.irange(index.bisect_left((min_copies,)), len(index), reverse=True))
+        entries = heapq.merge(*parts, reverse=True)
+        return [entry[-1] for entry in islice(entries, limit)]
+
+    def day_counts(self, start, end, content_type=None, pinned=None):
+        """
+        [start, end) 内每天的项目数 [(当天零点的时间戳, 数量)]，start 向前对齐到当天零点
+        每天只需两次二分，用于日期跳转和按日期浏览
+        """
+        indexes = [self.by_time[group] for group in self._groups(content_type, pinned)]
+        counts = []
+        day = start - start % DAY_MICROSECONDS
+        while day < end:
+            next_day = day + DAY_MICROSECONDS
+            counts.append((day, sum(index.bisect_left((next_day,)) - index.bisect_left((day,))
+                                    for index in indexes)))
+            day = next_day
+        return counts
+
+
+class TopK:
+    """
+    常用程度最高的 size 个内容键，按 (排序值, 内容键) 保存在升序列表中
+    排序值只会在复制或固定时变大，集合外的项目只需在修改时与第 size 名比较；
+    集合内的项目被删除后第 size+1 名未知，标记为 stale，由调用方在下次读取前用 reset 重新选出
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = []  # 升序 [(排序值, 内容键)]
+        self.scores = {}  # 内容键 -> 排序值
+        self.stale = False
+
+    def __len__(self):
+        return len(self.entries)
+
+    def reset(self, entries):
+        """从全部 [(排序值, 内容键)] 中重新选出前 size 项"""
+        self.entries = heapq.nlargest(self.size, entries)
+        self.entries.reverse()
+        self.scores = {key: score for score, key in self.entries}
+        self.stale = False
+
+    def offer(self, key, score):
+        """新增或修改一项(排序值只增不减)"""
+        old = self.scores.pop(key, None)
+        if old is not None:
+            del self.entries[bisect_left(self.entries, (old, key))]
+        elif len(self.entries) >= self.size:
+            if (score, key) <= self.entries[0]:
+                return
+            _, dropped = self.entries.pop(0)
+            del self.scores[dropped]
+        insort(self.entries, (score, key))
+        self.scores[key] = score
+
+    def discard(self, key):
+        """删除一项"""
+        score = self.scores.pop(key, None)
+        if score is not None:
+            del self.entries[bisect_left(self.entries, (score, key))]
+            self.stale = True
+
+    def top(self, count=None):
+        """排序值最高的内容键，最高的在前"""
+        return [key for _, key in reversed(self.entries[-count:] if count else self.entries)]
+
+
+def _fuzzy_text(text):
+    """模糊搜索比较的文本：开头 FUZZY_TEXT_CHARS 个字符转为小写，换行替换为空格(换行用于分隔文本)"""
+    return text[:FUZZY_TEXT_CHARS].lower().replace("\n", " ")
+
+
+def _subsequence_pattern(query):
+    """
+    按顺序包含 query 全部字符(子序列)的正则表达式，用 match(文本列, 开始, 结束) 匹配一条文本
+    每个字符之前用占有量词跳过不是该字符的内容，不会回溯；其中的一个分组是第一个字符到最后一个字符的范围
+    """
+    parts = []
+    for char in query:
+        char = re.escape(char)
+        parts.append(f"[^{char}]*+{char}" if parts else f"[^{char}]*+({char}")
+    return "".join(parts) + ")"
+
+
+def _set_bits(mask):
+    """整数中为 1 的位的序号(从低位开始)"""
+    bits = bin(mask)[:1:-1]
+    pos = bits.find('1')
+    while pos >= 0:
+        yield pos
+        pos = bits.find('1', pos + 1)
+
+
+class _FuzzyBlock:
+    """模糊搜索文本列的一块"""
+    __slots__ = ('column', 'offsets', 'keys', 'added', 'dirty', 'renumber', 'chars')
+
+    def __init__(self):
+        self.column = ""  # 以换行分隔的小写文本
+        self.offsets = array('q', [0])  # 块内序号 -> 文本在 column 中的起始位置，最后一项是下一条文本的起始位置
+        self.keys = []  # 块内序号 -> 内容键，已删除的为 None
+        self.added = []  # 上次拼接之后加入的文本
+        self.dirty = False  # 有文本加入或删除，搜索前需要重新拼接
+        self.renumber = False  # 有文本删除，重新拼接后块内序号会改变
+        self.chars = {}  # 字符 -> 包含该字符的文本的位图(第 i 位对应块内序号 i)，搜索用到时才计算
+
+
+class FuzzyIndex:
+    """
+    模糊搜索的文本列
+    每条文本只保留开头部分(见 _fuzzy_text)，按 FUZZY_BLOCK_SIZE 条一块拼接成一个长字符串，起始位置存在 array 中；
+    每块为查询中出现过的字符缓存一个位图(Python 整数，第 i 位表示第 i 条文本包含该字符)，
+    搜索时先把查询各字符的位图按位与，一次运算筛掉整块中不可能匹配的文本，
+    再对剩下的候选在文本列上直接用 str.find 和编译好的正则表达式匹配并打分，不切分出单条文本
+    得分(越大越好)：
+    - 包含连续的查询：开头 4，单词开头 3.5，其他位置 3
+    - 按顺序包含查询的全部字符：1 + 查询长度/匹配范围长度，从单词开头匹配再加 0.5
+      (匹配范围从第一个字符最早出现的位置算起)
+    - 去掉查询中一个字符后按顺序包含(容忍一个多余或打错的字符，只在结果不足时查找)：(查询长度/匹配范围长度) / 2
+    新增只追加到最后一块，删除只标记；修改过的块在下一次搜索前重新拼接(同时去掉删除的文本)
+    """
+    def __init__(self):
+        self.blocks = []
+        self.locations = {}  # 内容键 -> (块, 块内序号)
+
+    def __len__(self):
+        return len(self.locations)
+
+    def reset(self, texts):
+        """按 [(内容键, 文本)] 重建(整块加入，第一次搜索时拼接)"""
+        self.blocks = []
+        self.locations = {}
+        texts = iter(texts)
+        while True:
+            chunk = list(islice(texts, FUZZY_BLOCK_SIZE))
+            if not chunk:
+                break
+            block = _FuzzyBlock()
+            block.keys = [key for key, _ in chunk]
+            block.added = [_fuzzy_text(text) for _, text in chunk]
+            block.dirty = True
+            self.locations.update((key, (block, doc)) for doc, key in enumerate(block.keys))
+            self.blocks.append(block)
+
+    def add(self, key, text):
+        """加入一条文本"""
+        if key in self.locations:
+            self.remove(key)
+        if not self.blocks or len(self.blocks[-1].keys) >= FUZZY_BLOCK_SIZE:
+            self.blocks.append(_FuzzyBlock())
+        block = self.blocks[-1]
+        doc = len(block.keys)
+        text = _fuzzy_text(text)
+        self.locations[key] = (block, doc)
+        block.keys.append(key)
+        block.added.append(text)
+        block.dirty = True
+        chars = block.chars
+        for char, mask in chars.items():
+            if char in text:
+                chars[char] = mask | (1 << doc)
+
+    def remove(self, key):
+        """删除一条文本"""
+        location = self.locations.pop(key, None)
+        if location is None:
+            return
+        block, doc = location
+        block.keys[doc] = None
+        block.dirty = True
+        block.renumber = True
+
+    def _join(self, block):
+        """重新拼接修改过的块，去掉已删除的文本"""
+        if not block.renumber:
+            # 只有新加入的文本：接在文本列末尾，块内序号不变
+            added = block.added
+            if len(block.offsets) > 1:
+                block.column = "\n".join([block.column, *added])
+            else:
+                block.column = "\n".join(added)
+            block.offsets.extend(islice(accumulate([len(text) + 1 for text in added], initial=block.offsets[-1]), 1, None))
+            block.added = []
+            block.dirty = False
+            return
+
+        column, offsets = block.column, block.offsets
+        count = len(offsets) - 1
+        texts = []
+        keys = []
+        for doc, key in enumerate(block.keys):
+            if key is None:
+                continue
+            if doc < count:
+                texts.append(column[offsets[doc]:offsets[doc + 1] - 1])
+            else:
+                texts.append(block.added[doc - count])
+            self.locations[key] = (block, len(keys))
+            keys.append(key)
+        starts = array('q', [0])
+        for text in texts:
+            starts.append(starts[-1] + len(text) + 1)
+        block.column = "\n".join(texts)
+        block.offsets = starts
+        block.keys = keys
+        block.added = []
+        block.dirty = False
+        block.chars = {}
+        block.renumber = False
+
+    @staticmethod
+    def _char_masks(block, chars):
+        """块中分别包含 chars 中各字符的文本的位图(缓存)"""
+        cached = block.chars
+        missing = [char for char in chars if char not in cached]
+        if missing:
+            texts = block.column.split("\n")
+            texts.reverse()  # 第 0 条文本对应最低位
+            for char in missing:
+                cached[char] = int("".join(["1" if char in text else "0" for text in texts]), 2)
+        return [cached[char] for char in chars]
+
+    def search(self, query, enough=FUZZY_TYPO_RESULTS):
+        """
+        模糊搜索，返回全部命中文本的 [(得分, 内容键)](不排序)
+        命中数少于 enough 时再查找容忍一个多余或打错字符的匹配
+        """
+        query = _fuzzy_text(query)
+        if not query:
+            return []
+        for block in self.blocks:
+            if block.dirty:
+                self._join(block)
+        self.blocks = [block for block in self.blocks if block.keys]
+
+        size = len(query)
+        chars = list(dict.fromkeys(query))
+        subsequence = re.compile(_subsequence_pattern(query))
+        scores = {}
+        for block in self.blocks:
+            column, offsets, keys = block.column, block.offsets, block.keys
+            mask = -1
+            for char_mask in self._char_masks(block, chars):
+                mask &= char_mask
+            for doc in _set_bits(mask):
+                start, end = offsets[doc], offsets[doc + 1] - 1
+                pos = column.find(query, start, end)
+                if pos >= 0:
+                    score = 4 if pos == start else 3.5 if not column[pos - 1].isalnum() else 3
+                else:
+                    match = subsequence.match(column, start, end)
+                    if match is None:
+                        continue
+                    pos, last = match.span(1)
+                    score = 1 + size / (last - pos) + (0 if pos > start and column[pos - 1].isalnum() else 0.5)
+                scores[keys[doc]] = score
+
+        if len(scores) < enough and size >= FUZZY_TYPO_MIN:
+            variants = list(dict.fromkeys(query[:i] + query[i + 1:] for i in range(size)))
+            # 各个去掉一个字符的查询合成一个正则表达式，命中的分组就是匹配的范围
+            typo = re.compile("|".join(f"(?:{_subsequence_pattern(variant)})" for variant in variants))
+            variant_chars = [list(dict.fromkeys(variant)) for variant in variants]
+            for block in self.blocks:
+                column, offsets, keys = block.column, block.offsets, block.keys
+                # 包含某个去掉一个字符的查询中的全部字符
+                char_masks = dict(zip(chars, self._char_masks(block, chars)))
+                mask = 0
+                for variant in variant_chars:
+                    variant_mask = -1
+                    for char in variant:
+                        variant_mask &= char_masks[char]
+                    mask |= variant_mask
+                for doc in _set_bits(mask):
+                    key = keys[doc]
+                    if key in scores:
+                        continue
+                    match = typo.match(column, offsets[doc], offsets[doc + 1] - 1)
+                    if match is not None:
+                        pos, last = match.span(match.lastindex)
+                        scores[key] = (size - 1) / (last - pos) / 2
+        return [(score, key) for key, score in scores.items()]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板历史项
+1. HistoryItem 用 __slots__ 保存字段，没有实例字典；时间戳为整数微秒，内容类型和固定状态合并为一个标志整数
+2. 内容键随历史项保存，复制和固定时不必重新计算哈希
+3. 复制次数、时间戳和固定状态原地修改，不再为修改一个字段重建整个历史项
+"""
+
+from datetime import datetime, timedelta
+
+# 标志位
+FLAG_IMAGE = 1  # 内容类型为图片(否则为文本)
+FLAG_PINNED = 2  # 已固定
+
+EPOCH = datetime(1970, 1, 1)  # 时间戳按本地时间保存，不做时区换算
+MICROSECOND = timedelta(microseconds=1)
+
+
+def from_datetime(timestamp):
+    """datetime 转为整数微秒"""
+    return (timestamp - EPOCH) // MICROSECOND
+
+
+def to_datetime(value):
+    """整数微秒转为 datetime(先拆成秒和微秒，比直接按微秒构造 timedelta 快)"""
+    seconds, microseconds = divmod(value, 1000000)
+    return EPOCH + timedelta(0, seconds, microseconds)
+
+
+def now_timestamp():
+    """当前本地时间的整数微秒"""
+    return from_datetime(datetime.now())
+
+
+class HistoryItem:
+    """一条剪贴板历史"""
+    __slots__ = ('key', 'content', 'timestamp', 'copy_count', 'flags')
+
+    def __init__(self, key, content_type, content, timestamp, copy_count=0, is_pinned=False):
+        self.key = key  # 内容键
+        self.content = content  # 文本、图片字节或二进制存储引用(BlobRef)
+        self.timestamp = timestamp  # 最后修改时间(本地时间的整数微秒)
+        self.copy_count = copy_count
+        self.flags = (FLAG_IMAGE if content_type == "image" else 0) | (FLAG_PINNED if is_pinned else 0)
+
+    @classmethod
+    def from_tuple(cls, key, item):
+        """由旧版的 (content_type, content, timestamp, copy_count, is_pinned) 元组创建"""
+        content_type, content, timestamp, copy_count, is_pinned = item
+        return cls(key, content_type, content, from_datetime(timestamp), copy_count, is_pinned)
+
+    @property
+    def content_type(self):
+        return "image" if self.flags & FLAG_IMAGE else "text"
+
+    @property
+    def is_pinned(self):
+        return bool(self.flags & FLAG_PINNED)
+
+    @is_pinned.setter
+    def is_pinned(self, value):
+        self.flags = self.flags | FLAG_PINNED if value else self.flags & ~FLAG_PINNED
+
+    def time(self):
+        """最后修改时间(datetime)"""
+        return to_datetime(self.timestamp)
+
+    def state(self):
+        """影响显示顺序的字段 (时间戳, 复制次数, 是否固定)，修改前保存一份用于定位旧位置"""
+        return (self.timestamp, self.copy_count, self.is_pinned)
+
+    def __repr__(self):
+        return f"HistoryItem({self.content_type}, {self.content!r:.40}, {self.time()}, {self.copy_count}, {self.is_pinned})"
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板历史的追加式日志存储
+1. 每次变更只追加一条记录(新增/更新/删除)，不再整体重写历史文件
+2. 每条记录带长度和CRC32校验，进程中途退出留下的残缺尾部在加载时自动截断
+3. 垃圾记录过多时压缩：写入临时文件后原子替换
+4. 文本的内容键直接由接收时的 UTF-8 编码计算，去掉首尾空白时不复制文本
+5. 记录格式见 record_format.py；旧版 pickle 格式的日志在加载时一次性重写为当前格式
+6. 无法加载的日志(例如版本更新的程序写入的)改名保留，不在其后追加也不压缩覆盖
+"""
+
+import os
+import re
+import struct
+import zlib
+import hashlib
+from blob_store import BlobRef
+from history_item import HistoryItem, from_datetime
+from record_format import (OP_PUT, OP_UPDATE, OP_DELETE, LOG_MAGIC, FILE_HEADER,
+                           file_header, check_header, encode_op, decode_op, legacy_loads)
+
+# 记录头: 负载长度, 负载CRC32
+RECORD_HEADER = struct.Struct('<II')
+
+COMPACT_MIN_BYTES = 4 * 1024 * 1024  # 日志小于此大小时不压缩
+COMPACT_RATIO = 2  # 日志大小超过有效数据的倍数时压缩
+
+
+LEADING_SPACE = re.compile(r'\s*')  # 与 str.strip() 去掉的空白字符相同
+
+
+def _digest(content_type, data):
+    """内容类型和内容字节的摘要"""
+    digest = hashlib.blake2b(content_type.encode('utf-8'), digest_size=16)
+    digest.update(b'\0')
+    digest.update(data)
+    return digest.digest()
+
+
+def encode_text(text):
+    """文本的 UTF-8 编码(保留孤立的代理字符)"""
+    return text.encode('utf-8', errors='surrogatepass')
+
+
+def text_key(text, data):
+    """
+    由文本和它的 UTF-8 编码 data 计算内容键(与 record_key 相同)
+    首尾空白直接在 data 上按字节偏移跳过，不复制文本也不重新编码
+    """
+    start = LEADING_SPACE.match(text).end()
+    end = len(text)
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if start == 0 and end == len(text):
+        return _digest("text", data)
+    head = len(encode_text(text[:start]))
+    tail = len(encode_text(text[end:]))
+    return _digest("text", memoryview(data)[head:len(data) - tail])
+
+
+def record_key(content_type, content):
+    """计算历史项的内容键：文本去掉首尾空白后比较，图片按原始字节比较"""
+    if isinstance(content, BlobRef):
+        return content.key  # 存入二进制存储时已经算好
+    if content_type == "text":
+        text = content.decode('utf-8', errors='replace') if isinstance(content, bytes) else str(content)
+        return text_key(text, encode_text(text))
+    return _digest(content_type, bytes(content))
+
+
+def _decode_legacy_op(payload):
+    """解码旧版 pickle 格式的日志操作，时间戳转为整数微秒"""
+    op = legacy_loads(payload)
+    if op[0] == OP_PUT:
+        return op[:4] + (from_datetime(op[4]),) + op[5:]
+    if op[0] == OP_UPDATE:
+        return op[:2] + (from_datetime(op[2]),) + op[3:]
+    return op
+
+
+class HistoryLog:
+    """追加式历史记录日志"""
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.live_bytes = {}  # 内容键 -> 该记录 put 的字节数
+        self.live_total = 0  # 有效记录的总字节数
+        self.file_size = 0
+        self.read_only = False  # 无法加载又无法改名保留时不再写入
+
+    def exists(self):
+        """日志文件是否存在"""
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        重放日志，返回 {内容键: HistoryItem} 字典(按写入顺序)
+        """
+        # 清理压缩中断时残留的临时文件
+        tmp_path = self.path + '.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        records = {}
+        self.live_bytes = {}
+        self.live_total = 0
+        good_offset = 0
+        legacy = False
+        if os.path.exists(self.path):
+            # 逐条读取，不把整个文件读入内存
+            with open(self.path, 'rb') as f:
+                if check_header(f.read(FILE_HEADER.size), LOG_MAGIC):
+                    decode = decode_op
+                    good_offset = FILE_HEADER.size
+                else:
+                    # 旧版 pickle 格式(没有文件头)
+                    decode = _decode_legacy_op
+                    legacy = True
+                    f.seek(0)
+                while True:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    length, crc = RECORD_HEADER.unpack(header)
+                    payload = f.read(length)
+                    if len(payload) < length or zlib.crc32(payload) != crc:
+                        break  # 残缺或损坏的尾部
+                    try:
+                        op = decode(payload)
+                    except Exception:
+                        break
+                    good_offset += RECORD_HEADER.size + length
+                    self._apply(records, op, RECORD_HEADER.size + length)
+                file_size = f.seek(0, os.SEEK_END)
+
+            if good_offset < file_size:
+                print(f"历史日志尾部损坏，已截断 {file_size - good_offset} 字节")
+                with open(self.path, 'r+b') as f:
+                    f.truncate(good_offset)
+
+        self.file_size = good_offset
+        if legacy:
+            self.compact(records)
+        else:
+            self._open()
+        return records
+
+    def _apply(self, records, op, size):
+        """将一条日志操作应用到记录表"""
+        kind, key = op[0], op[1]
+        if kind == OP_PUT:
+            records.pop(key, None)
+            records[key] = HistoryItem(key, *op[2:])
+            self._set_live(key, size)
+        elif kind == OP_UPDATE:
+            item = records.get(key)
+            if item is not None:
+                item.timestamp, item.copy_count, item.is_pinned = op[2:]
+        elif kind == OP_DELETE:
+            records.pop(key, None)
+            self._set_live(key, 0)
+
+    def _set_live(self, key, size):
+        """记录某个内容键当前有效的字节数(0 表示已删除)"""
+        self.live_total -= self.live_bytes.pop(key, 0)
+        if size:
+            self.live_bytes[key] = size
+            self.live_total += size
+
+    def set_aside(self):
+        """
+        把无法加载的日志改名为 .unreadable(已存在时加序号)保留，之后的变更写入新的日志，返回保留的路径
+        改名失败时日志变为只读，本次运行的变更不再写入
+        """
+        self.close()
+        aside = self.path + '.unreadable'
+        number = 1
+        while os.path.exists(aside):
+            number += 1
+            aside = f"{self.path}.unreadable{number}"
+        try:
+            os.replace(self.path, aside)
+        except OSError:
+            self.read_only = True
+            raise
+        self.live_bytes = {}
+        self.live_total = 0
+        self.file_size = 0
+        return aside
+
+    def _open(self):
+        """以追加模式打开日志，新文件先写入文件头"""
+        if self.file is None:
+            self.file = open(self.path, 'ab')
+            if self.file.tell() == 0:
+                self.file.write(file_header(LOG_MAGIC))
+                self.file.flush()
+                self.file_size = FILE_HEADER.size
+
+    @staticmethod
+    def _encode(op, data=None):
+        """编码一条日志记录(记录头 + 负载)"""
+        payload = encode_op(op, data)
+        return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+    @classmethod
+    def _encode_put(cls, item, data=None):
+        """编码历史项的完整记录，data 为文本内容已有的 UTF-8 编码"""
+        return cls._encode((OP_PUT, item.key, item.content_type, item.content,
+                            item.timestamp, item.copy_count, item.is_pinned), data)
+
+    def write(self, changes, encoded=None):
+        """
+        写入一批变更，只调用一次 write 和 flush
+        changes 为 [(操作类型, 内容键, HistoryItem)]，删除操作的历史项可以为 None；
+        encoded 为 {内容键: 文本内容已有的 UTF-8 编码}，这些文本直接写入不再编码
+        """
+        if self.read_only:
+            return
+        encoded = encoded or {}
+        records = []
+        for kind, key, item in changes:
+            if kind == OP_PUT:
+                record = self._encode_put(item, encoded.get(key))
+                self._set_live(key, len(record))
+            elif kind == OP_UPDATE:
+                record = self._encode((OP_UPDATE, key, item.timestamp, item.copy_count, item.is_pinned))
+            else:
+                record = self._encode((OP_DELETE, key))
+                self._set_live(key, 0)
+            records.append(record)
+        data = b''.join(records)
+        self._open()
+        self.file.write(data)
+        self.file.flush()
+        self.file_size += len(data)
+
+    def put(self, item):
+        """写入完整的历史项"""
+        self.write([(OP_PUT, item.key, item)])
+
+    def update(self, item):
+        """只写入历史项的时间戳、复制次数和固定状态"""
+        self.write([(OP_UPDATE, item.key, item)])
+
+    def delete(self, item):
+        """删除历史项"""
+        self.write([(OP_DELETE, item.key, item)])
+
+    def needs_compaction(self):
+        """日志中的过期记录是否已足够多"""
+        return (self.file_size > COMPACT_MIN_BYTES
+                and self.file_size > self.live_total * COMPACT_RATIO)
+
+    def compact(self, records):
+        """用当前的全部历史项 {内容键: HistoryItem} 重写日志(临时文件 + 原子替换)"""
+        if self.read_only:
+            return
+        tmp_path = self.path + '.tmp'
+        live_bytes = {}
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            f.write(file_header(LOG_MAGIC))
+            for key, item in records.items():
+                record = self._encode_put(item)
+                f.write(record)
+                live_bytes[key] = len(record)
+                size += len(record)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.close()
+        os.replace(tmp_path, self.path)
+        self.live_bytes = live_bytes
+        self.live_total = size
+        self.file_size = FILE_HEADER.size + size
+        self._open()
+
+    def close(self):
+        """关闭日志文件"""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
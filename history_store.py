@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板历史引擎
+1. 判重、固定、复制次数、容量淘汰、搜索和持久化都在 HistoryStore 中完成，不依赖任何界面控件
+2. 变化通过 Qt 信号通知(新增/删除/更新/整体替换)，窗口只负责显示；无界面进程只需要 QCoreApplication
+3. 所有方法都在创建 HistoryStore 的线程中调用，磁盘写入由 PersistenceWorker 在后台完成
+4. 启动时由后台线程读取日志并按显示顺序分批交回，窗口可以立即显示；搜索索引在空闲时分段建立
+5. 按内容类型、固定状态、时间范围和复制次数的查询走二级索引(AttributeIndex)，搜索框可用 type:/is:/date:/copies: 条件筛选
+6. 常用程度最高的项目(TopK)随每次新增、复制和固定增量维护，取常用项目不需要排序全部历史
+7. 以 ~ 开头的搜索为模糊搜索(FuzzyIndex)，容忍漏输入的字符和一个打错的字符，按匹配程度排序
+"""
+
+import os
+import re
+import time
+import heapq
+from datetime import datetime
+from collections import deque
+from PyQt6.QtCore import QObject, QTimer, QCoreApplication, QEventLoop, pyqtSignal
+from history_log import HistoryLog, record_key, encode_text, text_key
+from history_item import HistoryItem, now_timestamp, from_datetime
+from history_index import (OrderedIndex, TrigramIndex, AttributeIndex, TopK, FuzzyIndex, sort_key, frecency,
+                           DAY_MICROSECONDS, INDEX_TEXT_CHARS)
+from history_eviction import HistoryEvictor, EVICT_LRU
+from blob_store import BlobStore, BlobRef, content_text, LARGE_TEXT_CHARS
+from persistence import PersistenceWorker
+
+EXPIRE_CHECK_MS = 60 * 60 * 1000  # 检查过期历史项的间隔(毫秒)
+SEARCH_RESULT_LIMIT = 1000  # 搜索结果最多返回的项目数量
+FRECENT_ITEMS = 50  # 增量维护的常用项目数量
+INDEX_SLICE_MS = 10  # 每次空闲时建立搜索索引的最长时间(毫秒)
+
+# 搜索框中的筛选条件，例如 "type:image date:2024-05-01..2024-05-07 is:pinned copies:3"
+FILTER_TOKEN = re.compile(r'(type|is|date|copies):(\S+)$')
+CONTENT_TYPE_NAMES = {"text": "text", "文本": "text", "image": "image", "图片": "image"}
+PINNED_NAMES = {"pinned": True, "固定": True, "unpinned": False, "未固定": False}
+
+# 读取完整内容的用途
+LOAD_COPY = 'copy'  # 复制回剪贴板
+LOAD_DETAIL = 'detail'  # 在详情窗口中查看
+
+
+def _parse_day(value):
+    """YYYY-MM-DD 转为当天零点的整数微秒时间戳"""
+    return from_datetime(datetime.strptime(value, "%Y-%m-%d"))
+
+
+def _search_prefix(content):
+    """
+    文本历史项交给搜索索引的文本，开头 INDEX_TEXT_CHARS 个字符与 content_text 相同(搜索只比较这一部分)
+    一般直接返回历史项本身的字符串，索引只保存引用；会换成二进制存储引用的超长文本只复制开头部分，
+    无法解码的二进制只解码开头部分(UTF-8 每个字符不超过4字节)
+    """
+    content_type = type(content)
+    if content_type is str:
+        return content if len(content) <= LARGE_TEXT_CHARS else content[:INDEX_TEXT_CHARS]
+    if content_type is bytes:
+        return content[:INDEX_TEXT_CHARS * 4].decode('utf-8', errors='replace')
+    return content_text(content)
+
+
+def parse_query(text):
+    """
+    从搜索文本中取出筛选条件，返回 (其余文本, 条件字典)
+    type:text|image 内容类型，is:pinned|unpinned 固定状态，copies:N 至少复制 N 次，
+    date:YYYY-MM-DD 或 date:YYYY-MM-DD..YYYY-MM-DD 日期范围(含两端)；无法识别的条件按普通文本处理
+    """
+    filters = {}
+    words = []
+    for word in text.split(' '):
+        match = FILTER_TOKEN.match(word)
+        try:
+            if match is None:
+                raise ValueError(word)
+            name, value = match.groups()
+            if name == "type":
+                filters["content_type"] = CONTENT_TYPE_NAMES[value]
+            elif name == "is":
+                filters["pinned"] = PINNED_NAMES[value]
+            elif name == "copies":
+                filters["min_copies"] = int(value)
+            else:
+                first, _, last = value.partition("..")
+                filters["start"] = _parse_day(first)
+                filters["end"] = _parse_day(last or first) + DAY_MICROSECONDS
+        except (KeyError, ValueError):
+            words.append(word)
+    if not filters:
+        return text, filters
+    return " ".join(word for word in words if word), filters
+
+
+class HistoryStore(QObject):
+    """
+    剪贴板历史
+    历史项为 HistoryItem，以内容键标识；修改时原地更新字段
+    """
+    itemAdded = pyqtSignal(bytes, object)  # 新增(内容键, 历史项)
+    itemsAdded = pyqtSignal(object)  # add_many 新增的一批 [(内容键, 历史项)]
+    itemRemoved = pyqtSignal(bytes, object)  # 删除(内容键, 历史项)
+    itemUpdated = pyqtSignal(bytes, object, object)  # 更新(内容键, 历史项, 修改前的 HistoryItem.state())
+    historyReset = pyqtSignal()  # 全部历史项被整体替换(清除)
+    itemsLoaded = pyqtSignal(object)  # 启动加载的一批历史项 [(内容键, 历史项)]，按加载时的排序规则排列
+    historyLoaded = pyqtSignal()  # 启动加载完成
+    contentLoaded = pyqtSignal(object, object, str)  # load_content 完成(历史项, 完整内容, 用途)
+    loadFailed = pyqtSignal(object, str, str)  # load_content 失败(历史项, 错误信息, 用途)
+
+    def __init__(self, data_dir=None, parent=None):
+        super().__init__(parent)
+        data_dir = data_dir or os.path.expanduser("~")
+        self.log_path = os.path.join(data_dir, ".clipboard_history.log")
+        self.legacy_path = os.path.join(data_dir, ".clipboard_history")  # 旧版整体pickle文件
+        self.items = {}  # 内容键 -> 历史项，用于常数时间判重和查找
+        self.search_index = TrigramIndex()  # 文本内容的搜索索引
+        # 内容类型、固定状态、时间和复制次数的二级索引，第一次按条件查询时整体建立，之后随修改维护
+        # (启动加载时不逐项插入)；None 表示尚未建立
+        self.attributes = None
+        self.frecent = TopK(FRECENT_ITEMS)  # 常用程度最高的项目
+        self.fuzzy = None  # 模糊搜索的文本列，第一次模糊搜索时建立；None 表示尚未建立
+        self.evictor = HistoryEvictor()  # 容量限制和淘汰策略
+        self.blob_store = BlobStore(os.path.join(data_dir, ".clipboard_blobs"))  # 图片和超长文本
+        self.history_log = HistoryLog(self.log_path)
+        # 读取和写入全部交给后台线程
+        self.persistence = PersistenceWorker(self.history_log, self.blob_store, parent=self)
+        self.persistence.recordsLoaded.connect(self._records_loaded)
+        self.persistence.loadFinished.connect(self._load_finished)
+        self.persistence.payloadStored.connect(self._payload_stored)
+        self.persistence.contentLoaded.connect(self.contentLoaded)
+        self.persistence.loadFailed.connect(self.loadFailed)
+        self.persistence.failed.connect(print)
+        self.loaded = False  # 启动加载是否已完成
+        self.cleared_while_loading = False  # 加载期间清除过未固定项目，之后加载到的未固定项目一并删除
+        self.unindexed = deque()  # 已加载但尚未建立搜索索引的文本内容键
+        self.index_timer = QTimer(self)
+        self.index_timer.timeout.connect(self._index_slice)
+        self.expire_timer = QTimer(self)
+        self.expire_timer.timeout.connect(self.evict)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    # 加载和持久化
+
+    def load(self, sort_rule=0, wait=False):
+        """
+        开始在后台加载历史记录(须在修改历史之前调用)，立即返回是否存在已保存的历史
+        加载的历史项按 sort_rule 的显示顺序分批通过 itemsLoaded 发出，全部完成后发出 historyLoaded；
+        wait=True 时处理事件直到加载完成(无界面进程和基准测试使用)
+        """
+        has_history = self.history_log.exists() or os.path.exists(self.legacy_path)
+
+        # 加载排在之后的所有变更之前
+        self.persistence.load(self.legacy_path, sort_rule)
+
+        if wait:
+            while not self.loaded:
+                # 没有事件时阻塞等待，不空转抢占后台加载线程
+                QCoreApplication.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+        return has_history
+
+    def _records_loaded(self, batch):
+        """
+        后台线程加载的一批历史项
+        加载期间新增的同一内容保留已保存的固定状态和复制次数；加载期间清除过历史时，未固定的项目直接删除
+        """
+        added = []
+        for key, item in batch:
+            current = self.items.get(key)
+            if current is not None:
+                state = current.state()
+                current.is_pinned = current.is_pinned or item.is_pinned
+                current.copy_count = max(current.copy_count, item.copy_count)
+                self._updated(key, current, state)
+                continue
+            if self.cleared_while_loading and not item.is_pinned:
+                self.persistence.delete(key, item)
+                continue
+            self.items[key] = item
+            self.evictor.add(key, item)
+            self.frecent.offer(key, frecency(item.timestamp, item.copy_count))
+            if self.attributes is not None:
+                self.attributes.add(key, item)
+            if item.content_type == "text":
+                self.unindexed.append(key)
+                if self.fuzzy is not None:
+                    self.fuzzy.add(key, content_text(item.content))
+            added.append((key, item))
+        if self.unindexed and not self.index_timer.isActive():
+            self.index_timer.start(0)
+        self.itemsLoaded.emit(added)
+
+    def _load_finished(self, count):
+        """加载完成：按容量限制淘汰，之后定时检查过期项目"""
+        self.loaded = True
+        if self.cleared_while_loading:
+            self.cleared_while_loading = False
+            self.persistence.compact()
+        self.evict()
+        self.expire_timer.start(EXPIRE_CHECK_MS)
+        self.historyLoaded.emit()
+
+    def _index_slice(self):
+        """空闲时为已加载的文本建立搜索索引，每次最多 INDEX_SLICE_MS 毫秒"""
+        deadline = time.perf_counter() + INDEX_SLICE_MS / 1000
+        unindexed = self.unindexed
+        while unindexed and time.perf_counter() < deadline:
+            for _ in range(min(len(unindexed), 100)):
+                key = unindexed.popleft()
+                item = self.items.get(key)
+                if item is not None:
+                    self.search_index.add(key, _search_prefix(item.content))
+        if not unindexed:
+            self.index_timer.stop()
+
+    def finish_indexing(self):
+        """立即为剩余的已加载文本建立搜索索引"""
+        while self.unindexed:
+            key = self.unindexed.popleft()
+            item = self.items.get(key)
+            if item is not None:
+                self.search_index.add(key, _search_prefix(item.content))
+        self.index_timer.stop()
+
+    def close(self):
+        """写完队列中剩余的变更后停止后台线程"""
+        self.expire_timer.stop()
+        self.index_timer.stop()
+        self.persistence.stop()
+
+    def flush(self):
+        """立即写入尚在防抖等待中的变更(不等待写入完成)"""
+        self.persistence.flush()
+
+    def save_settings(self, path, settings):
+        """由后台线程保存设置"""
+        self.persistence.save_settings(path, settings)
+
+    def _rebuild_indexes(self):
+        """根据全部历史项重建搜索索引(超长文本只索引开头部分)和淘汰索引"""
+        self.search_index.clear()
+        self.unindexed.clear()
+        for key, item in self.items.items():
+            if item.content_type == "text":
+                self.search_index.add(key, _search_prefix(item.content))
+        self.evictor.reset(self.items)
+        self.attributes = None
+        self.fuzzy = None
+        self.frecent.reset((frecency(item.timestamp, item.copy_count), key) for key, item in self.items.items())
+
+    def blob_keys(self):
+        """全部存入二进制存储的内容键"""
+        return [item.content.key for item in self.items.values() if isinstance(item.content, BlobRef)]
+
+    # 修改
+
+    def get(self, key):
+        """内容键对应的历史项，不存在时返回 None"""
+        return self.items.get(key)
+
+    def add(self, content_type, content):
+        """
+        添加内容，返回内容键；内容为空或已存在时返回 None
+        超出容量限制时淘汰未固定的项目
+        """
+        item = self._insert(content_type, content, now_timestamp())
+        if item is None:
+            return None
+        self.itemAdded.emit(item.key, item)
+
+        self.evict()
+        return item.key
+
+    def add_many(self, events):
+        """
+        批量添加 [(内容类型, 内容)]，返回新增的内容键列表(按事件顺序)
+        整批只判重一次、淘汰一次，并只发出一次 itemsAdded；批内的时间戳按事件顺序递增
+        """
+        now = now_timestamp()
+        added = []
+        for content_type, content in events:
+            item = self._insert(content_type, content, now + len(added))
+            if item is not None:
+                added.append((item.key, item))
+        if added:
+            self.itemsAdded.emit(added)
+            self.evict()
+        return [key for key, _ in added]
+
+    def _insert(self, content_type, content, timestamp):
+        """判重后加入一个新历史项并交给后台写入，返回历史项；内容为空或已存在时返回 None"""
+        # 如果内容为空，不添加
+        if not content:
+            return None
+
+        # 如果是文本内容且是字节类型，解码为字符串
+        if content_type == "text" and isinstance(content, bytes):
+            try:
+                content = content.decode('utf-8')
+            except UnicodeDecodeError:
+                # 如果解码失败，使用原始字节数据
+                pass
+
+        # 检查内容是否已存在
+        # 文本只编码一次，内容键、容量统计、写入日志和存入二进制存储都使用这份编码
+        data = None
+        if content_type == "text" and isinstance(content, str):
+            data = encode_text(content)
+            key = text_key(content, data)
+        else:
+            key = record_key(content_type, content)
+        if key in self.items:
+            return None
+
+        # 添加新项目，初始复制次数为0
+        # 写入日志以及图片和超长文本存入二进制存储都由后台线程完成
+        item = HistoryItem(key, content_type, content, timestamp)
+        self.items[key] = item
+        self.persistence.put(key, item, data)
+        if content_type == "text":
+            self.search_index.add(key, _search_prefix(content))
+            if self.fuzzy is not None:
+                self.fuzzy.add(key, content_text(content))
+        self.evictor.add(key, item, None if data is None else len(data))
+        self.frecent.offer(key, frecency(item.timestamp, item.copy_count))
+        if self.attributes is not None:
+            self.attributes.add(key, item)
+        return item
+
+    def _updated(self, key, item, state):
+        """历史项已原地修改(state 为修改前的 HistoryItem.state())，写入并通知"""
+        self.evictor.update(key, item)
+        self.frecent.offer(key, frecency(item.timestamp, item.copy_count))
+        if self.attributes is not None:
+            self.attributes.update(key, item, state)
+        self.persistence.update(key, item)
+        self.itemUpdated.emit(key, item, state)
+
+    def touch(self, key):
+        """内容被复制回剪贴板：复制次数加一，时间戳更新为当前时间"""
+        item = self.items.get(key)
+        if item is None:
+            return
+        state = item.state()
+        item.timestamp = now_timestamp()
+        item.copy_count += 1
+        self._updated(key, item, state)
+
+    def set_pinned(self, key, is_pinned):
+        """修改固定状态，时间戳更新为当前时间"""
+        item = self.items.get(key)
+        if item is None:
+            return
+        state = item.state()
+        item.timestamp = now_timestamp()
+        item.is_pinned = is_pinned
+        self._updated(key, item, state)
+
+    def _payload_stored(self, key, ref):
+        """后台线程已把内容换成二进制存储引用，通知显示更新(位置不变)"""
+        item = self.items.get(key)
+        if item is not None and item.content is ref:
+            self.itemUpdated.emit(key, item, item.state())
+
+    def remove(self, key):
+        """删除历史项(包括其二进制内容)"""
+        item = self.items.pop(key, None)
+        if item is None:
+            return
+        self.search_index.remove(key)
+        if self.fuzzy is not None:
+            self.fuzzy.remove(key)
+        self.evictor.remove(key)
+        self.frecent.discard(key)
+        if self.attributes is not None:
+            self.attributes.remove(key, item)
+        self.persistence.delete(key, item)
+        self.itemRemoved.emit(key, item)
+
+    def clear_unpinned(self):
+        """删除全部未固定的项目，返回被删除的 [(内容键, 历史项)]"""
+        removed = [(key, item) for key, item in self.items.items() if not item.is_pinned]
+        if not self.loaded:
+            self.cleared_while_loading = True
+        self.items = {key: item for key, item in self.items.items() if item.is_pinned}  # 只保留固定项目
+        self._rebuild_indexes()
+        # 剩余项目很少，后台线程删除后直接压缩重写日志
+        for key, item in removed:
+            self.persistence.delete(key, item)
+        self.persistence.compact()
+        self.historyReset.emit()
+        return removed
+
+    def configure(self, limits=None, max_age_days=None, policy=EVICT_LRU):
+        """修改容量限制、最长保存天数和淘汰策略，并立即淘汰超出的项目"""
+        self.evictor.configure(limits, max_age_days, policy, self.items)
+        self.evict()
+
+    def evict(self):
+        """删除过期和超出容量限制的历史项，返回删除的数量"""
+        evicted = self.evictor.evict()
+        for key in evicted:
+            item = self.items.pop(key)
+            self.search_index.remove(key)
+            if self.fuzzy is not None:
+                self.fuzzy.remove(key)
+            self.frecent.discard(key)
+            if self.attributes is not None:
+                self.attributes.remove(key, item)
+            self.persistence.delete(key, item)
+            self.itemRemoved.emit(key, item)
+        return len(evicted)
+
+    # 查询
+
+    def query(self, sort_rule=0):
+        """按排序规则(固定项目在前)返回全部历史项"""
+        order = OrderedIndex(sort_key(sort_rule, key, item) for key, item in self.items.items())
+        return [entry[-1] for entry in order]
+
+    def attribute_index(self):
+        """二级索引，尚未建立时按全部历史项整体建立"""
+        if self.attributes is None:
+            self.attributes = AttributeIndex()
+            self.attributes.reset(self.items)
+        return self.attributes
+
+    def fuzzy_index(self):
+        """模糊搜索的文本列，尚未建立时按全部文本历史项整体建立"""
+        if self.fuzzy is None:
+            self.fuzzy = FuzzyIndex()
+            self.fuzzy.reset((key, content_text(item.content)) for key, item in self.items.items()
+                             if item.content_type == "text")
+        return self.fuzzy
+
+    def find(self, content_type=None, pinned=None, start=None, end=None, min_copies=None,
+             newest_first=True, after=None, limit=None):
+        """
+        按内容类型、固定状态和时间范围 [start, end)(整数微秒)查询历史项，按时间排序
+        after 为上一页最后一项的 (时间戳, 内容键)，用于分页；min_copies 在索引结果上逐项检查
+        """
+        predicate = None
+        if min_copies:
+            predicate = lambda key: self.items[key].copy_count >= min_copies
+        keys = self.attribute_index().find(content_type, pinned, start, end, newest_first, after, limit, predicate)
+        return [self.items[key] for key in keys]
+
+    def most_copied(self, content_type=None, pinned=None, min_copies=0, limit=None):
+        """复制次数不少于 min_copies 的历史项，复制次数多的在前"""
+        return [self.items[key] for key in self.attribute_index().most_copied(content_type, pinned, min_copies, limit)]
+
+    def count(self, content_type=None, pinned=None, start=None, end=None):
+        """满足条件的历史项数量(不遍历历史)"""
+        return self.attribute_index().count(content_type, pinned, start, end)
+
+    def day_counts(self, start, end, content_type=None, pinned=None):
+        """[start, end) 内每天的历史项数量 [(当天零点的时间戳, 数量)]"""
+        return self.attribute_index().day_counts(start, end, content_type, pinned)
+
+    def filter(self, filters, limit=SEARCH_RESULT_LIMIT):
+        """
+        只按筛选条件(parse_query 的结果)查询
+        只有复制次数条件时按复制次数从多到少，否则按时间从新到旧
+        """
+        if set(filters) <= {"content_type", "pinned", "min_copies"} and "min_copies" in filters:
+            return self.most_copied(limit=limit, **filters)
+        return self.find(limit=limit, **filters)
+
+    @staticmethod
+    def matches(item, filters):
+        """历史项是否满足筛选条件"""
+        if "content_type" in filters and item.content_type != filters["content_type"]:
+            return False
+        if "pinned" in filters and item.is_pinned != filters["pinned"]:
+            return False
+        if "start" in filters and not filters["start"] <= item.timestamp < filters["end"]:
+            return False
+        return item.copy_count >= filters.get("min_copies", 0)
+
+    def search(self, text, limit=SEARCH_RESULT_LIMIT):
+        """
+        搜索文本历史项(以 ^ 开头时按前缀匹配，以 ~ 开头时模糊搜索)，可带 type:/is:/date:/copies: 筛选条件(见 parse_query)
+        结果固定项目在前，其余按常用程度(复制次数和时间衰减)排序；只有筛选条件时直接查询二级索引
+        """
+        text, filters = parse_query(text)
+        if filters and not text:
+            return self.filter(filters, limit)
+        if text.startswith("~"):
+            return self.fuzzy_search(text[1:], filters, limit)
+        prefix = text.startswith("^")
+        query = text[1:] if prefix else text
+        keys = set(self.search_index.search(query, prefix))
+        if self.unindexed:
+            # 尚未建立索引的文本直接扫描
+            query = query.lower()
+            for key in self.unindexed:
+                item = self.items.get(key)
+                if item is None:
+                    continue
+                content = _search_prefix(item.content)[:INDEX_TEXT_CHARS].lower()
+                if content.startswith(query) if prefix else query in content:
+                    keys.add(key)
+        items = (self.items[key] for key in keys)
+        if filters:
+            items = (item for item in items if self.matches(item, filters))
+        return heapq.nlargest(limit, items, key=lambda item: (item.is_pinned, frecency(item.timestamp, item.copy_count)))
+
+    def fuzzy_search(self, text, filters=None, limit=SEARCH_RESULT_LIMIT):
+        """
+        模糊搜索文本历史项(只比较每条文本的开头部分，见 FuzzyIndex)
+        结果固定项目在前，其余按匹配程度排序，匹配程度相同时按常用程度排序
+        """
+        items = self.items
+        matches = ((score, items[key]) for score, key in self.fuzzy_index().search(text))
+        if filters:
+            matches = ((score, item) for score, item in matches if self.matches(item, filters))
+        ranked = heapq.nlargest(limit, matches, key=lambda match: (
+            match[1].is_pinned, match[0], frecency(match[1].timestamp, match[1].copy_count)))
+        return [item for _, item in ranked]
+
+    def frecent_items(self, count=FRECENT_ITEMS):
+        """常用程度最高的 count(不超过 FRECENT_ITEMS)个历史项，最常用的在前"""
+        if self.frecent.stale and len(self.items) > len(self.frecent):
+            # 常用项目被删除后从全部历史项中补足
+            self.frecent.reset((frecency(item.timestamp, item.copy_count), key) for key, item in self.items.items())
+        return [self.items[key] for key in self.frecent.top(count)]
+
+    def pinned_count(self):
+        """固定项目数量"""
+        return len(self.items) - self.evictor.unpinned_count()
+
+    def load_content(self, item, purpose=LOAD_COPY):
+        """
+        取得历史项的完整内容，完成后发出 contentLoaded
+        存入二进制存储的内容由后台线程读取
+        """
+        if isinstance(item.content, BlobRef):
+            self.persistence.load_content(item, purpose)
+            return
+        try:
+            content = self.blob_store.load(item.content_type, item.content)
+        except Exception as e:
+            self.loadFailed.emit(item, str(e), purpose)
+            return
+        self.contentLoaded.emit(item, content, purpose)
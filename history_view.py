@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板历史列表的模型/视图渲染
+1. HistoryListModel 只保存历史项引用，不为每项创建控件，变更时只通知受影响的行
+2. HistoryItemDelegate 直接绘制可见行，内存和重绘开销只与可视区域有关
+3. 行的颜色、画笔、字体和图标按主题预先创建，绘制时只查表，不解析样式表；
+   悬停、按下和切换主题都只需要重绘可见行
+4. 文本只排版开头有限的部分，按可见行数截断(末行加省略号)后缓存，重绘时不再排版；
+   完整内容只在复制或查看详情时读取
+"""
+
+from collections import OrderedDict
+
+from PyQt6.QtWidgets import QStyledItemDelegate, QStyle
+from PyQt6.QtCore import Qt, QSize, QRectF, QPointF, QModelIndex, QAbstractListModel, QEvent, pyqtSignal
+from PyQt6.QtGui import (QColor, QFont, QIcon, QPen, QBrush, QFontMetricsF, QStaticText,
+                         QTextLayout, QTextOption)
+from history_index import OrderedIndex, sort_key
+from blob_store import BlobRef, content_text
+
+# 常量定义
+ITEM_HEIGHT = 100  # 每个历史记录项的高度(像素)
+ITEM_SPACING = 8  # 历史记录项之间的间距(像素)
+MARGIN = 10  # 统一边距(像素)
+PIN_SIZE = 20  # 固定按钮区域大小(像素)
+PREVIEW_CHARS = 500  # 绘制文本时最多使用的字符数
+PREVIEW_CACHE_ITEMS = 512  # 缓存排版结果的行数
+
+# 每种主题的行颜色 (背景, 边框, 文字, 悬停背景, 按下背景)
+ROW_COLORS = {
+    False: ((255, 255, 255), (230, 230, 230), (50, 50, 50), (240, 240, 240), (230, 230, 230)),
+    True: ((50, 50, 50), (70, 70, 70), (220, 220, 220), (60, 60, 60), (70, 70, 70)),
+}
+
+
+class RowPalette:
+    """一种主题下绘制行所需的画刷和画笔，创建后不再修改"""
+    __slots__ = ('normal', 'hover', 'pressed', 'border', 'text', 'meta', 'shadow')
+
+    def __init__(self, is_dark):
+        bg, border, text, hover, pressed = (QColor(*rgb) for rgb in ROW_COLORS[is_dark])
+        self.normal = QBrush(bg)
+        self.hover = QBrush(hover)
+        self.pressed = QBrush(pressed)
+        self.border = QPen(border, 1)
+        self.text = QPen(text)
+        self.meta = QPen(QColor(128, 128, 128))  # 时间和复制次数
+        self.shadow = QBrush(QColor(0, 0, 0, 30))
+
+    def background(self, hover, pressed):
+        """按状态选择背景"""
+        return self.pressed if pressed else self.hover if hover else self.normal
+
+
+class HistoryListModel(QAbstractListModel):
+    """
+    历史记录列表模型
+    行顺序由有序索引维护，单个项目的新增、移动和删除只发出对应行的通知
+    显示搜索结果时改为显示结果列表，此时有序索引仍然更新但不发出行通知
+    """
+    ItemRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sort_rule = 0
+        self.order = OrderedIndex()
+        self.results = None  # 搜索结果(历史项列表)，None 表示显示完整列表
+
+    def reset(self, items, sort_rule):
+        """按排序规则重建全部显示项(items 为 {内容键: 历史项})"""
+        self.beginResetModel()
+        self.sort_rule = sort_rule
+        self.order = OrderedIndex(sort_key(sort_rule, key, item) for key, item in items.items())
+        self.results = None
+        self.endResetModel()
+
+    def set_results(self, results):
+        """显示搜索结果，results 为 None 时恢复完整列表"""
+        self.beginResetModel()
+        self.results = results
+        self.endResetModel()
+
+    def items(self):
+        """按行顺序遍历历史项"""
+        if self.results is not None:
+            yield from self.results
+            return
+        for entry in self.order:
+            yield entry[-1]
+
+    def item_at(self, row):
+        """指定行的历史项"""
+        if self.results is not None:
+            return self.results[row]
+        return self.order[row][-1]
+
+    def pinned_count(self):
+        """固定项目数量(固定项目总在最前)"""
+        return self.order.bisect_left((1,))
+
+    def insert_item(self, key, item):
+        """插入一个历史项，返回所在行(显示搜索结果时返回 -1)"""
+        entry = sort_key(self.sort_rule, key, item)
+        if self.results is not None:
+            self.order.insert(entry)
+            return -1
+        row = self.order.bisect_left(entry)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.order.insert(entry)
+        self.endInsertRows()
+        return row
+
+    def insert_items(self, items):
+        """
+        插入一批历史项 [(内容键, 历史项)](启动加载和批量接收时使用)
+        整批在显示顺序中连续(例如都排在现有行之后，或新内容都排在同一位置)时只发出一次插入通知，否则重置模型
+        """
+        entries = sorted(sort_key(self.sort_rule, key, item) for key, item in items)
+        if not entries:
+            return
+        if self.results is not None:
+            for entry in entries:
+                self.order.insert(entry)
+            return
+        row = self.order.bisect_left(entries[0])
+        if row == len(self.order) or entries[-1] < self.order[row]:
+            self.beginInsertRows(QModelIndex(), row, row + len(entries) - 1)
+            for entry in entries:
+                self.order.insert(entry)
+            self.endInsertRows()
+        else:
+            self.beginResetModel()
+            for entry in entries:
+                self.order.insert(entry)
+            self.endResetModel()
+
+    def remove_item(self, key, item):
+        """删除一个历史项"""
+        entry = sort_key(self.sort_rule, key, item)
+        if self.results is not None:
+            self.order.remove(entry)
+            return
+        row = self.order.index(entry)
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self.order.remove(entry)
+        self.endRemoveRows()
+
+    def update_item(self, key, item, state):
+        """
+        历史项已原地修改(state 为修改前的 HistoryItem.state())，位置变化时移动该行，
+        返回新的行号(显示搜索结果时返回 -1)
+        """
+        old_entry = sort_key(self.sort_rule, key, item, state)
+        new_entry = sort_key(self.sort_rule, key, item)
+        if self.results is not None:
+            self.order.remove(old_entry)
+            self.order.insert(new_entry)
+            return -1
+        old_row = self.order.index(old_entry)
+        if new_entry[:-1] == old_entry[:-1]:
+            new_row = old_row  # 只有内容变化(例如换成二进制存储引用)，位置不变
+        else:
+            new_row = self.order.bisect_left(new_entry)
+            if new_row > old_row:
+                new_row -= 1  # 不含旧行时的位置
+
+        if new_row == old_row:
+            self.order.remove(old_entry)
+            self.order.insert(new_entry)
+        else:
+            # beginMoveRows 的目标位置以移动前的行号计
+            dest = new_row + 1 if new_row > old_row else new_row
+            self.beginMoveRows(QModelIndex(), old_row, old_row, QModelIndex(), dest)
+            self.order.remove(old_entry)
+            self.order.insert(new_entry)
+            self.endMoveRows()
+        index = self.index(new_row)
+        self.dataChanged.emit(index, index)
+        return new_row
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.results) if self.results is not None else len(self.order)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < self.rowCount():
+            return None
+        item = self.item_at(index.row())
+        if role == self.ItemRole:
+            return item
+        if role == Qt.ItemDataRole.DisplayRole:
+            if item.content_type == "text":
+                return content_text(item.content)
+            return "[图片]"
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemFlag.NoItemFlags
+        return Qt.ItemFlag.ItemIsEnabled
+
+
+class HistoryItemDelegate(QStyledItemDelegate):
+    """历史记录项绘制代理"""
+    itemClicked = pyqtSignal(object)  # 点击项目(复制)
+    pinClicked = pyqtSignal(object)  # 点击固定按钮
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.is_dark = False
+        self.pressed_row = -1
+        self.thumbnails = None  # ThumbnailCache，为 None 时图片只显示占位文字
+        self.palettes = {False: RowPalette(False), True: RowPalette(True)}
+        self.pin_icons = {True: QIcon.fromTheme("pin"), False: QIcon.fromTheme("unpin")}
+        self.base_font = None  # 创建 meta_font/body_font 时视图的字体
+        self.meta_font = None
+        self.body_font = None
+        self.line_height = 0  # 内容字体的行距
+        self.previews = OrderedDict()  # (内容键, 宽度) -> 排好版的预览行 [QStaticText]，最近使用的在末尾
+
+    def fonts(self, font):
+        """时间行和内容的字体，视图字体变化时才重新创建"""
+        if font != self.base_font:
+            self.base_font = QFont(font)
+            self.meta_font = QFont(font)
+            self.meta_font.setPixelSize(11)
+            self.body_font = QFont(font)
+            self.body_font.setPixelSize(12)
+            self.line_height = QFontMetricsF(self.body_font).lineSpacing()
+            self.previews.clear()
+        return self.meta_font, self.body_font
+
+    def preview_lines(self, item, width, height):
+        """
+        文本历史项在 width x height 区域中的预览行
+        只排版开头 PREVIEW_CHARS 个字符，放不下时末行以省略号结尾；结果按内容键和宽度缓存
+        """
+        cache_key = (item.key, int(width))
+        lines = self.previews.get(cache_key)
+        if lines is not None:
+            self.previews.move_to_end(cache_key)
+            return lines
+
+        full_text = content_text(item.content)
+        text = full_text[:PREVIEW_CHARS]
+        # 存入二进制存储的超长文本只有开头部分，同样视为未显示完
+        more = len(full_text) > PREVIEW_CHARS or isinstance(item.content, BlobRef)
+        metrics = QFontMetricsF(self.body_font)
+        max_lines = max(1, int(height // self.line_height))
+        option = QTextOption()
+        option.setWrapMode(QTextOption.WrapMode.WrapAnywhere)
+
+        # 逐段排版，多排一行用来判断是否放得下
+        texts = []  # [(行首在 text 中的位置, 行文本)]
+        offset = 0
+        for paragraph in text.split('\n'):
+            layout = QTextLayout(paragraph, self.body_font)
+            layout.setTextOption(option)
+            layout.beginLayout()
+            while len(texts) <= max_lines:
+                line = layout.createLine()
+                if not line.isValid():
+                    break
+                line.setLineWidth(width)
+                start = line.textStart()
+                texts.append((offset + start, paragraph[start:start + line.textLength()]))
+            layout.endLayout()
+            offset += len(paragraph) + 1
+            if len(texts) > max_lines:
+                break
+
+        if texts and (len(texts) > max_lines or more):
+            # 末行换成从该行开头起的全部剩余文本，超出宽度的部分用省略号代替
+            texts = texts[:max_lines]
+            start = texts[-1][0]
+            rest = text[start:].replace('\n', ' ') + ('…' if more else '')
+            texts[-1] = (start, metrics.elidedText(rest, Qt.TextElideMode.ElideRight, width))
+
+        lines = []
+        for _, line_text in texts:
+            static = QStaticText(line_text)
+            static.setTextFormat(Qt.TextFormat.PlainText)
+            static.setPerformanceHint(QStaticText.PerformanceHint.AggressiveCaching)
+            lines.append(static)
+        self.previews[cache_key] = lines
+        if len(self.previews) > PREVIEW_CACHE_ITEMS:
+            self.previews.popitem(last=False)
+        return lines
+
+    def sizeHint(self, option, index):
+        return QSize(option.rect.width(), ITEM_HEIGHT + ITEM_SPACING)
+
+    @staticmethod
+    def card_rect(option):
+        """项目卡片区域(去掉底部间距)"""
+        return QRectF(option.rect).adjusted(0.5, 0.5, -0.5, -ITEM_SPACING - 0.5)
+
+    @staticmethod
+    def pin_rect(card):
+        """固定按钮区域"""
+        return QRectF(card.right() - MARGIN - PIN_SIZE, card.top() + 5, PIN_SIZE, PIN_SIZE)
+
+    def paint(self, painter, option, index):
+        """绘制一个历史记录项"""
+        item = index.data(HistoryListModel.ItemRole)
+        if item is None:
+            return
+        content_type, content, copy_count, is_pinned = item.content_type, item.content, item.copy_count, item.is_pinned
+        palette = self.palettes[self.is_dark]
+        meta_font, body_font = self.fonts(option.font)
+
+        # 根据状态确定背景
+        hover = bool(option.state & QStyle.StateFlag.State_MouseOver)
+        pressed = index.row() == self.pressed_row
+
+        painter.save()
+        painter.setRenderHint(painter.RenderHint.Antialiasing)
+
+        # 卡片背景和阴影
+        card = self.card_rect(option)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(palette.shadow)
+        painter.drawRoundedRect(card.translated(0, 1), 6, 6)
+        painter.setPen(palette.border)
+        painter.setBrush(palette.background(hover, pressed))
+        painter.drawRoundedRect(card, 6, 6)
+
+        # 时间和复制次数
+        time_str = item.time().strftime("%Y-%m-%d %H:%M:%S")
+        count_str = f"复制 {copy_count} 次" if copy_count > 0 else "未复制"
+        painter.setFont(meta_font)
+        painter.setPen(palette.meta)
+        header = QRectF(card.left() + MARGIN, card.top() + 5,
+                        card.width() - 2 * MARGIN - PIN_SIZE - 5, PIN_SIZE)
+        painter.drawText(header, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter,
+                         f"{time_str} | {count_str}")
+
+        # 固定按钮
+        pin = self.pin_rect(card)
+        icon = self.pin_icons[is_pinned]
+        if not icon.isNull():
+            icon.paint(painter, pin.adjusted(2, 2, -2, -2).toRect())
+        else:
+            painter.setOpacity(1.0 if is_pinned else 0.3)
+            painter.drawText(pin, Qt.AlignmentFlag.AlignCenter, "📌")
+            painter.setOpacity(1.0)
+
+        # 内容
+        body = QRectF(card.left() + MARGIN, header.bottom() + 5,
+                      card.width() - 2 * MARGIN, card.bottom() - header.bottom() - 10)
+        painter.setClipRect(body)
+        if content_type == "image" and self.thumbnails is not None and isinstance(content, BlobRef):
+            # 缩略图未生成时先显示占位文字，生成后由视图重绘
+            pixmap = self.thumbnails.pixmap(content)
+            if pixmap is not None:
+                size = pixmap.size().toSizeF().scaled(body.size(), Qt.AspectRatioMode.KeepAspectRatio)
+                if size.width() > pixmap.width():
+                    size = pixmap.size().toSizeF()  # 不放大
+                painter.drawPixmap(QRectF(body.topLeft(), size), pixmap, QRectF(pixmap.rect()))
+                painter.restore()
+                return
+        painter.setFont(body_font)
+        painter.setPen(palette.text)
+        if content_type == "text":
+            y = body.top()
+            for line in self.preview_lines(item, body.width(), body.height()):
+                painter.drawStaticText(QPointF(body.left(), y), line)
+                y += self.line_height
+        else:
+            painter.drawText(body, Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignTop, "[图片]")
+
+        painter.restore()
+
+    def editorEvent(self, event, model, option, index):
+        """处理鼠标点击：固定按钮切换固定状态，其他区域复制内容"""
+        if event.type() == QEvent.Type.MouseButtonPress and event.button() == Qt.MouseButton.LeftButton:
+            self.pressed_row = index.row()
+            option.widget.update(index)
+            return True
+        if event.type() == QEvent.Type.MouseButtonRelease and event.button() == Qt.MouseButton.LeftButton:
+            was_pressed = self.pressed_row == index.row()
+            self.pressed_row = -1
+            option.widget.update(index)
+            if was_pressed:
+                item = index.data(HistoryListModel.ItemRole)
+                if self.pin_rect(self.card_rect(option)).contains(event.position()):
+                    self.pinClicked.emit(item)
+                else:
+                    self.itemClicked.emit(item)
+            return True
+        return super().editorEvent(event, model, option, index)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+剪贴板事件的接收队列
+1. 监视器读到的内容先放入队列，第一项到达后等待 INGEST_BATCH_MS 毫秒再整批交给 HistoryStore.add_many，
+   一批只判重一次、淘汰一次、通知显示一次，写盘由 PersistenceWorker 合并
+2. 每批最多处理 INGEST_MAX_BATCH 项，剩余的在下一次事件循环中继续，界面不会被一次长时间的处理卡住
+3. 历史尚未加载完成时只排队不处理(启动时监视器读到的当前剪贴板内容通常就是已保存的最新一项)，
+   加载完成后再整批处理；退出前的 flush 不等待加载
+4. 队列有上限，生产速度超过处理速度时的合并/丢弃规则：
+   - 与队尾相同的内容直接合并(连续复制同一内容只保留一次)
+   - 事件数超过 INGEST_MAX_PENDING 或内容总大小超过 INGEST_MAX_PENDING_BYTES 时丢弃最早的事件，
+     最新的内容总是保留；丢弃的数量通过 eventsDropped 通知
+"""
+
+from collections import deque
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+INGEST_BATCH_MS = 50  # 第一项到达后等待多久处理一批(毫秒)
+INGEST_MAX_BATCH = 200  # 每批最多处理的事件数
+INGEST_MAX_PENDING = 1000  # 队列最多保留的事件数
+INGEST_MAX_PENDING_BYTES = 256 * 1024 * 1024  # 队列中内容的总大小上限(文本按字符数计)
+
+
+class IngestQueue(QObject):
+    """有上限的剪贴板事件队列，按批交给 HistoryStore"""
+    batchIngested = pyqtSignal(int, int)  # 处理了一批(事件数, 新增的历史项数)
+    eventsDropped = pyqtSignal(int)  # 因队列已满丢弃的事件数
+
+    def __init__(self, store, parent=None, delay_ms=INGEST_BATCH_MS, max_batch=INGEST_MAX_BATCH,
+                 max_pending=INGEST_MAX_PENDING, max_bytes=INGEST_MAX_PENDING_BYTES):
+        super().__init__(parent)
+        self.store = store
+        self.delay_ms = delay_ms
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.pending = deque()  # [(内容类型, 内容)]
+        self.pending_bytes = 0
+        self.dropped = 0  # 累计丢弃的事件数
+        self.merged = 0  # 累计合并的事件数
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.drain)
+        store.historyLoaded.connect(self._store_loaded)
+
+    def __len__(self):
+        return len(self.pending)
+
+    def submit(self, content_type, content):
+        """放入一个剪贴板事件(可直接连接 PasteboardMonitor.clipboardChanged)"""
+        if not content:
+            return
+        event = (content_type, content)
+        if self.pending and self.pending[-1] == event:
+            self.merged += 1
+            return
+        self.pending.append(event)
+        self.pending_bytes += len(content)
+
+        # 超出上限时丢弃最早的事件，刚放入的一项总是保留
+        dropped = 0
+        while len(self.pending) > 1 and (len(self.pending) > self.max_pending or self.pending_bytes > self.max_bytes):
+            _, old = self.pending.popleft()
+            self.pending_bytes -= len(old)
+            dropped += 1
+        if dropped:
+            self.dropped += dropped
+            self.eventsDropped.emit(dropped)
+
+        if not self.timer.isActive():
+            self.timer.start(self.delay_ms)
+
+    def drain(self):
+        """处理一批事件，还有剩余时在下一次事件循环中继续；历史尚未加载完成时等待 historyLoaded"""
+        if not self.store.loaded:
+            return
+        self._ingest()
+        if self.pending:
+            self.timer.start(0)
+
+    def flush(self):
+        """立即处理队列中的全部事件(退出前调用)"""
+        self.timer.stop()
+        while self.pending:
+            self._ingest()
+
+    def _store_loaded(self):
+        """历史加载完成，处理加载期间排队的事件"""
+        if self.pending and not self.timer.isActive():
+            self.timer.start(0)
+
+    def _ingest(self):
+        """把最多 max_batch 个事件交给 HistoryStore"""
+        count = min(len(self.pending), self.max_batch)
+        if not count:
+            return
+        batch = [self.pending.popleft() for _ in range(count)]
+        self.pending_bytes -= sum(len(content) for _, content in batch)
+        added = self.store.add_many(batch)
+        self.batchIngested.emit(count, len(added))
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+macOS 剪贴板后端
+1. 通过 NSPasteboard 读写系统剪贴板
+2. 监听系统的剪贴板变化通知，并定时检查系统主题
+"""
+
+from AppKit import NSPasteboard, NSObject, NSData
+import objc
+from Foundation import NSDistributedNotificationCenter
+from Cocoa import NSApp
+from clipboard_backend import ClipboardBackend, TYPE_TEXT
+
+THEME_CHECK_INTERVAL = 1.0  # 主题检查间隔(秒)
+
+
+class SystemObserver(NSObject):
+    """系统剪贴板变化通知和主题变化监视"""
+    def initWithSignals_(self, signals):
+        self = objc.super(SystemObserver, self).init()
+        if not self:
+            return None
+
+        self.signals = signals
+        self.current_theme_dark = is_dark_appearance()
+
+        # 设置剪贴板变化通知
+        center = NSDistributedNotificationCenter.defaultCenter()
+        center.addObserver_selector_name_object_(
+            self, 'clipboardChanged:', 'com.apple.pasteboard.clipboardChanged', None)
+
+        # 定时检查主题变化
+        self.theme_timer = NSTimer.scheduledTimerWithTimeInterval_target_selector_userInfo_repeats_(
+            THEME_CHECK_INTERVAL, self, 'checkTheme:', None, True)
+
+        return self
+
+    def checkTheme_(self, timer):
+        """检查系统主题变化"""
+        is_dark = is_dark_appearance()
+        if is_dark != self.current_theme_dark:
+            self.current_theme_dark = is_dark
+            self.signals.themeChanged.emit(is_dark)
+
+    def clipboardChanged_(self, notification):
+        """剪贴板变化通知处理：立即检查一次，不必等到下次定时检查"""
+        self.signals.pasteboardNotified.emit()
+
+# 注册Objective-C选择器
+SystemObserver.clipboardChanged_ = objc.selector(
+    SystemObserver.clipboardChanged_,
+    signature=b'v@:@'
+)
+SystemObserver.checkTheme_ = objc.selector(
+    SystemObserver.checkTheme_,
+    signature=b'v@:@'
+)
+
+NSTimer = objc.lookUpClass('NSTimer')
+
+
+def is_dark_appearance():
+    """系统当前是否为暗色外观"""
+    return "dark" in NSApp.effectiveAppearance().name().lower()
+
+
+class MacBackend(ClipboardBackend):
+    """macOS 系统剪贴板"""
+    def __init__(self):
+        self.pasteboard = NSPasteboard.generalPasteboard()
+        self.observer = None
+
+    def change_count(self):
+        return self.pasteboard.changeCount()
+
+    def types(self):
+        return list(self.pasteboard.types() or ())
+
+    def read(self, pasteboard_type):
+        if pasteboard_type == TYPE_TEXT:
+            # 转为普通 str，历史项不再持有 NSString
+            text = self.pasteboard.stringForType_(pasteboard_type)
+            return str(text) if text is not None else None
+        data = self.pasteboard.dataForType_(pasteboard_type)
+        return bytes(data) if data is not None else None
+
+    def write(self, pasteboard_type, data):
+        self.pasteboard.clearContents()
+        if pasteboard_type == TYPE_TEXT:
+            self.pasteboard.setString_forType_(data, pasteboard_type)
+        else:
+            ns_data = NSData.dataWithBytes_length_(data, len(data))
+            self.pasteboard.setData_forType_(ns_data, pasteboard_type)
+
+    def is_dark_theme(self):
+        return is_dark_appearance()
+
+    def watch(self, signals):
+        self.observer = SystemObserver.alloc().initWithSignals_(signals)
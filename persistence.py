@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+后台持久化线程
+1. 界面线程只把变更放入队列，日志写入、压缩、图片存储、缩略图和设置保存都在后台线程完成
+2. 写入经过防抖：第一项变更到达后最多等待 max_latency 秒或积累 max_batch 项变更，
+   合并同一项目的多次变更后一次写入，因此无论剪贴板变化多频繁，写盘次数都有上限；
+   加载、flush 和停止不等待，退出时一定写完剩余变更
+3. 启动时由后台线程读取历史日志，读完后立即选出最先显示的一批交给界面线程，
+   内容迁移、存储清理和其余部分的排序在此之后进行，其余历史项再按显示顺序分批交回
+4. 结果通过 Qt 信号通知回界面线程
+"""
+
+import os
+import time
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+from history_log import OP_PUT, OP_UPDATE, OP_DELETE, record_key
+from history_item import HistoryItem
+from record_format import encode_settings, legacy_loads
+from history_index import sort_key
+from blob_store import BlobRef, externalize
+
+OP_LOAD = 'load'  # 加载历史
+OP_COMPACT = 'compact'  # 压缩日志
+OP_SETTINGS = 'settings'  # 保存设置
+OP_FLUSH = 'flush'  # 立即写入
+LOAD_BATCH = 2000  # 加载时每批交给界面线程的历史项数量
+FLUSH_MAX_LATENCY = 0.5  # 变更最多延迟多久写入(秒)
+FLUSH_MAX_BATCH = 500  # 积累多少项变更时不再等待，立即写入
+_STOP = object()  # 停止后台线程
+
+
+class PersistenceWorker(QObject):
+    """历史记录和设置的后台持久化"""
+    batchWritten = pyqtSignal(int)  # 一批变更已写入(合并后的记录数)
+    payloadStored = pyqtSignal(bytes, object)  # 内容已存入二进制存储(内容键, BlobRef)
+    contentLoaded = pyqtSignal(object, object, str)  # 完整内容读取完成(历史项, 内容, 用途)
+    loadFailed = pyqtSignal(object, str, str)  # 完整内容读取失败(历史项, 错误信息, 用途)
+    failed = pyqtSignal(str)  # 后台写入失败(错误信息)
+    recordsLoaded = pyqtSignal(object)  # 一批已加载的历史项 [(内容键, 历史项)]，按显示顺序
+    loadFinished = pyqtSignal(int)  # 加载完成(历史项总数)
+
+    def __init__(self, history_log, blob_store, records=None, parent=None,
+                 max_latency=FLUSH_MAX_LATENCY, max_batch=FLUSH_MAX_BATCH):
+        super().__init__(parent)
+        self.history_log = history_log
+        self.blob_store = blob_store
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self.records = dict(records or {})  # 后台线程自己的 {内容键: 历史项} 表(与界面线程共用历史项对象)，用于压缩
+        self.queue = queue.Queue()
+        self.loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="content-loader")
+        self.thread = threading.Thread(target=self.run, name="persistence", daemon=True)
+        self.thread.start()
+
+    # 以下方法在界面线程中调用
+
+    def load(self, legacy_path, sort_rule):
+        """在后台加载历史(必须在其他变更之前调用)，旧版整体pickle文件一次性迁移到日志"""
+        self.queue.put((OP_LOAD, legacy_path, sort_rule))
+
+    def put(self, key, item, data=None):
+        """新增历史项，data 为文本已有的 UTF-8 编码(写入日志或存入二进制存储时直接使用)"""
+        self.queue.put((OP_PUT, key, (item, data)))
+
+    def update(self, key, item):
+        """更新历史项的时间戳、复制次数和固定状态"""
+        self.queue.put((OP_UPDATE, key, item))
+
+    def delete(self, key, item):
+        """删除历史项及其二进制内容"""
+        self.queue.put((OP_DELETE, key, item))
+
+    def compact(self):
+        """请求压缩日志"""
+        self.queue.put((OP_COMPACT, None, None))
+
+    def save_settings(self, path, settings):
+        """保存设置(同一批中只写最后一次)"""
+        self.queue.put((OP_SETTINGS, path, settings))
+
+    def flush(self):
+        """不再等待，立即写入队列中的变更"""
+        self.queue.put((OP_FLUSH, None, None))
+
+    def load_content(self, item, purpose):
+        """在后台读取历史项的完整内容，完成后发出 contentLoaded(purpose 原样带回)"""
+        self.loader.submit(self._load, item, purpose)
+
+    def stop(self):
+        """写完队列中剩余的变更后停止后台线程"""
+        if self.thread.is_alive():
+            self.queue.put(_STOP)
+            self.thread.join()
+        self.loader.shutdown(wait=True)
+        self.history_log.close()
+
+    # 以下方法在后台线程中执行
+
+    def _load(self, item, purpose):
+        """读取完整内容"""
+        try:
+            self.contentLoaded.emit(item, self.blob_store.load(item.content_type, item.content), purpose)
+        except Exception as e:
+            self.loadFailed.emit(item, str(e), purpose)
+
+    def _load_history(self, legacy_path, sort_rule):
+        """
+        读取历史日志(或迁移旧版文件)，立即发出按显示顺序最先显示的一批，
+        然后把仍直接保存在记录中的图片和超长文本移入二进制存储、清理不再被引用的存储内容，
+        最后按显示顺序分批发出其余的历史项
+        """
+        records = {}
+        loaded = False
+        try:
+            if self.history_log.exists():
+                records = self.history_log.load()
+            elif os.path.exists(legacy_path):
+                with open(legacy_path, 'rb') as f:
+                    history = legacy_loads(f.read())
+                for item in history:
+                    key = record_key(item[0], item[1])
+                    records[key] = HistoryItem.from_tuple(key, item)
+                self.history_log.compact(records)
+                os.replace(legacy_path, legacy_path + ".bak")
+            loaded = True
+        except Exception as e:
+            self.failed.emit(f"加载历史记录失败: {e}")
+            records = {}
+            if self.history_log.exists():
+                # 不在无法加载的日志后追加，也不让之后的压缩覆盖它
+                try:
+                    self.failed.emit(f"无法加载的历史记录已另存为 {self.history_log.set_aside()}")
+                except OSError as e:
+                    self.failed.emit(f"保留无法加载的历史记录失败，本次运行不保存历史: {e}")
+        self.records = records
+
+        # 首屏只需要从全部记录中选出最先显示的一批，不必等待整理和完整排序
+        order = lambda kv: sort_key(sort_rule, kv[0], kv[1])
+        head = heapq.nsmallest(LOAD_BATCH, records.items(), key=order)
+        if head:
+            self.recordsLoaded.emit(head)
+
+        if loaded:
+            try:
+                self._migrate(records, {key for key, _ in head})
+            except Exception as e:
+                self.failed.emit(f"整理历史记录失败: {e}")
+
+        if len(records) > len(head):
+            shown = {key for key, _ in head}
+            ordered = sorted(((key, item) for key, item in records.items() if key not in shown), key=order)
+            for start in range(0, len(ordered), LOAD_BATCH):
+                self.recordsLoaded.emit(ordered[start:start + LOAD_BATCH])
+        self.loadFinished.emit(len(records))
+
+    def _migrate(self, records, shown):
+        """
+        加载后的整理：仍直接保存在记录中的图片和超长文本移入二进制存储(shown 中已经发出的历史项通过 payloadStored 通知)，
+        清理不再被引用的存储内容，安排上次退出前尚未转码的图片
+        """
+        migrated = False
+        for key, item in records.items():
+            content = externalize(self.blob_store, key, item.content_type, item.content)
+            if content is not item.content:
+                item.content = content
+                migrated = True
+                if key in shown:
+                    self.payloadStored.emit(key, content)
+        if migrated:
+            self.history_log.compact(records)
+        blob_keys = [item.content.key for item in records.values() if isinstance(item.content, BlobRef)]
+        self.blob_store.sweep(blob_keys)
+        # 上次退出前尚未转码的图片
+        self.blob_store.schedule_transcode(item.content.key for item in records.values()
+                                           if item.content_type == "image" and isinstance(item.content, BlobRef))
+
+    def run(self):
+        """后台线程主循环"""
+        while True:
+            batch = [self.queue.get()]
+            # 防抖：等待后续变更，直到超过最长延迟、积累足够多的变更或需要立即处理
+            deadline = time.monotonic() + self.max_latency
+            while len(batch) < self.max_batch and not self._urgent(batch[-1]):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            stop = any(op is _STOP for op in batch)
+            try:
+                self.process([op for op in batch if op is not _STOP])
+            except Exception as e:
+                self.failed.emit(f"保存历史记录失败: {e}")
+            if stop:
+                return
+
+    @staticmethod
+    def _urgent(op):
+        """是否需要立即处理(加载、flush 和停止)"""
+        return op is _STOP or op[0] in (OP_LOAD, OP_FLUSH)
+
+    def process(self, batch):
+        """合并并写入一批变更"""
+        dirty = {}  # 内容键 -> 合并后的操作类型
+        encoded = {}  # 内容键 -> 文本接收时的 UTF-8 编码
+        removed = {}  # 内容键 -> 被删除的历史项
+        compact = False
+        settings = None
+
+        for kind, key, item in batch:
+            if kind == OP_LOAD:
+                self._load_history(key, item)
+            elif kind == OP_PUT:
+                item, data = item
+                self.records[key] = item
+                dirty[key] = OP_PUT
+                if data is not None:
+                    encoded[key] = data
+            elif kind == OP_UPDATE:
+                # 历史项已在界面线程中原地修改，这里只记录需要写入
+                if key not in self.records:
+                    continue
+                if dirty.get(key) != OP_PUT:
+                    dirty[key] = OP_UPDATE
+            elif kind == OP_DELETE:
+                current = self.records.pop(key, None)
+                if current is not None:
+                    removed[key] = current
+                dirty[key] = OP_DELETE
+            elif kind == OP_COMPACT:
+                compact = True
+            elif kind == OP_SETTINGS:
+                settings = (key, item)
+
+        # 新增的图片和超长文本存入二进制存储
+        # 内容换成引用后释放原始数据(属性赋值是原子的，界面线程读到的总是完整的内容或引用)
+        for key, kind in dirty.items():
+            if kind != OP_PUT:
+                continue
+            item = self.records[key]
+            try:
+                content = externalize(self.blob_store, key, item.content_type, item.content, encoded.get(key))
+            except OSError as e:
+                self.failed.emit(f"保存内容失败: {e}")
+                continue
+            if content is not item.content:
+                item.content = content
+                self.payloadStored.emit(key, content)
+
+        if compact:
+            self.history_log.compact(self.records)
+        elif dirty:
+            self.history_log.write([(kind, key, self.records.get(key)) for key, kind in dirty.items()], encoded)
+            if self.history_log.needs_compaction():
+                self.history_log.compact(self.records)
+
+        # 日志写入后再删除不再引用的二进制内容
+        for key, item in removed.items():
+            if key not in self.records and isinstance(item.content, BlobRef):
+                self.blob_store.delete(item.content.key)
+
+        if settings is not None:
+            path, values = settings
+            try:
+                # 写入临时文件后原子替换，中途退出不会留下残缺的设置文件
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(encode_settings(values))
+                os.replace(path + '.tmp', path)
+            except Exception as e:
+                self.failed.emit(f"保存设置失败: {e}")
+
+        self.batchWritten.emit(len(dirty))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+历史日志和设置文件的二进制格式
+1. 日志文件以魔数和版本号开头，每条操作用固定结构的 struct 头加变长内容编码，时间戳为整数微秒
+2. 设置文件同样以魔数和版本号开头，内容为 UTF-8 JSON
+3. 读取时不执行任何代码；旧版 pickle 文件只在一次性迁移时读取，且只允许还原已知的类型
+"""
+
+import io
+import json
+import pickle
+import struct
+from blob_store import BlobRef
+
+FORMAT_VERSION = 1  # 当前格式版本
+LOG_MAGIC = b'CHLOG'  # 日志文件魔数
+SETTINGS_MAGIC = b'CHSET'  # 设置文件魔数
+FILE_HEADER = struct.Struct('<5sB')  # 魔数, 版本号
+
+# 日志操作类型
+OP_PUT = 'put'        # 完整记录(含内容)
+OP_UPDATE = 'update'  # 仅更新时间戳、复制次数和固定状态
+OP_DELETE = 'delete'  # 删除记录
+OP_CODES = {OP_PUT: 1, OP_UPDATE: 2, OP_DELETE: 3}
+
+CONTENT_TYPES = ("text", "image")  # 内容类型编号
+CONTENT_TYPE_CODES = {name: code for code, name in enumerate(CONTENT_TYPES)}
+
+# 内容和预览的存储方式
+KIND_NONE = 0
+KIND_STR = 1
+KIND_BYTES = 2
+KIND_BLOB = 3
+
+# 操作码, 内容键, 内容类型, 时间戳(微秒), 复制次数, 是否固定, 内容存储方式；其后为内容
+PUT_RECORD = struct.Struct('<B16sBqI?B')
+# 原始内容字节数, 预览存储方式；其后为预览
+BLOB_RECORD = struct.Struct('<QB')
+# 操作码, 内容键, 时间戳(微秒), 复制次数, 是否固定
+UPDATE_RECORD = struct.Struct('<B16sqI?')
+# 操作码, 内容键
+DELETE_RECORD = struct.Struct('<B16s')
+
+
+class FormatError(ValueError):
+    """文件格式或版本不受支持"""
+
+
+def file_header(magic):
+    """文件头"""
+    return FILE_HEADER.pack(magic, FORMAT_VERSION)
+
+
+def check_header(data, magic):
+    """
+    检查文件头，返回是否为当前格式(False 表示旧版 pickle 格式)
+    版本号比当前程序新时抛出 FormatError
+    """
+    if len(data) < FILE_HEADER.size or not data.startswith(magic):
+        return False
+    _, version = FILE_HEADER.unpack_from(data)
+    if version > FORMAT_VERSION:
+        raise FormatError(f"文件版本 {version} 高于支持的版本 {FORMAT_VERSION}")
+    return True
+
+
+def _encode_value(value):
+    """内容或预览的存储方式和字节"""
+    if value is None:
+        return KIND_NONE, b''
+    if isinstance(value, str):
+        return KIND_STR, value.encode('utf-8', errors='surrogatepass')
+    return KIND_BYTES, bytes(value)
+
+
+def _decode_value(kind, data):
+    """按存储方式还原内容或预览"""
+    if kind == KIND_STR:
+        return data.decode('utf-8', errors='surrogatepass')
+    if kind == KIND_BYTES:
+        return data
+    if kind == KIND_NONE:
+        return None
+    raise FormatError(f"未知的内容存储方式 {kind}")
+
+
+def encode_op(op, data=None):
+    """
+    编码一条日志操作
+    op 为 (OP_PUT, 内容键, 内容类型, 内容, 时间戳, 复制次数, 是否固定)、
+    (OP_UPDATE, 内容键, 时间戳, 复制次数, 是否固定) 或 (OP_DELETE, 内容键)，时间戳为整数微秒
+    data 为 OP_PUT 文本内容已有的 UTF-8 编码，省略时重新编码
+    """
+    kind, key = op[0], op[1]
+    if kind == OP_PUT:
+        _, _, content_type, content, timestamp, copy_count, is_pinned = op
+        if isinstance(content, BlobRef):
+            preview_kind, preview = _encode_value(content.preview)
+            header = PUT_RECORD.pack(OP_CODES[OP_PUT], key, CONTENT_TYPE_CODES[content_type],
+                                     timestamp, copy_count, is_pinned, KIND_BLOB)
+            return header + BLOB_RECORD.pack(content.size, preview_kind) + preview
+        if data is not None and isinstance(content, str):
+            content_kind = KIND_STR
+        else:
+            content_kind, data = _encode_value(content)
+        return PUT_RECORD.pack(OP_CODES[OP_PUT], key, CONTENT_TYPE_CODES[content_type],
+                               timestamp, copy_count, is_pinned, content_kind) + data
+    if kind == OP_UPDATE:
+        _, _, timestamp, copy_count, is_pinned = op
+        return UPDATE_RECORD.pack(OP_CODES[OP_UPDATE], key, timestamp, copy_count, is_pinned)
+    return DELETE_RECORD.pack(OP_CODES[OP_DELETE], key)
+
+
+def decode_op(payload):
+    """解码一条日志操作，返回与 encode_op 参数相同的元组"""
+    code = payload[0]
+    if code == 1:
+        _, key, type_code, ts, copy_count, is_pinned, kind = PUT_RECORD.unpack_from(payload)
+        if kind == KIND_BLOB:
+            size, preview_kind = BLOB_RECORD.unpack_from(payload, PUT_RECORD.size)
+            preview = _decode_value(preview_kind, payload[PUT_RECORD.size + BLOB_RECORD.size:])
+            content = BlobRef(key, size, preview)
+        else:
+            content = _decode_value(kind, payload[PUT_RECORD.size:])
+        return (OP_PUT, key, CONTENT_TYPES[type_code], content, ts, copy_count, is_pinned)
+    if code == 2:
+        _, key, ts, copy_count, is_pinned = UPDATE_RECORD.unpack(payload)
+        return (OP_UPDATE, key, ts, copy_count, is_pinned)
+    if code == 3:
+        _, key = DELETE_RECORD.unpack(payload)
+        return (OP_DELETE, key)
+    raise FormatError(f"未知的日志操作 {code}")
+
+
+def encode_settings(settings):
+    """编码设置字典"""
+    return file_header(SETTINGS_MAGIC) + json.dumps(settings, ensure_ascii=False).encode('utf-8')
+
+
+def decode_settings(data):
+    """解码设置文件内容(也接受旧版 pickle 格式)，返回设置字典"""
+    if check_header(data, SETTINGS_MAGIC):
+        settings = json.loads(data[FILE_HEADER.size:].decode('utf-8'))
+    else:
+        settings = legacy_loads(data)
+    if not isinstance(settings, dict):
+        raise FormatError("设置文件内容不是字典")
+    return settings
+
+
+class LegacyUnpickler(pickle.Unpickler):
+    """读取旧版 pickle 文件，只允许还原历史项中出现的类型"""
+    ALLOWED = {("datetime", "datetime"), ("blob_store", "BlobRef")}
+
+    def find_class(self, module, name):
+        if (module, name) not in self.ALLOWED:
+            raise pickle.UnpicklingError(f"旧版文件中不允许的类型 {module}.{name}")
+        return super().find_class(module, name)
+
+
+def legacy_loads(data):
+    """安全地解码旧版 pickle 数据"""
+    return LegacyUnpickler(io.BytesIO(data)).load()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+图片历史项的缩略图缓存
+1. 缩略图在后台线程中用 Pillow 解码并缩小到列表行内容区域的高度，界面线程不解码原图
+2. 生成的缩略图按内容键保存在磁盘上，下次启动直接读取；删除和清理缩略图文件也在后台线程中进行
+3. 内存中用 LRU 缓存最近绘制过的 QPixmap，只保留有限数量
+"""
+
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtGui import QPixmap
+from blob_store import make_thumbnail
+
+THUMBNAIL_HEIGHT = 64  # 缩略图高度(像素)，与列表行内容区域的高度一致
+THUMBNAIL_MAX_WIDTH = 320  # 缩略图最大宽度(像素)
+PIXMAP_CACHE_ITEMS = 256  # 内存中最多缓存的缩略图数量
+
+
+class ThumbnailCache(QObject):
+    """
+    按内容键缓存缩略图
+    pixmap() 未命中时返回 None 并交给后台线程生成，完成后发出 thumbnailReady
+    """
+    thumbnailReady = pyqtSignal(bytes)  # 某个内容键的缩略图已可用
+
+    _loaded = pyqtSignal(bytes, object)  # 后台线程生成完成(内容键, PNG 字节或 None)
+
+    def __init__(self, root, blob_store, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.blob_store = blob_store
+        self.pixmaps = OrderedDict()  # 内容键 -> QPixmap，最近使用的在末尾
+        self.pending = set()  # 正在生成的内容键
+        self.failed = set()  # 无法生成缩略图的内容键(不再重试)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail")
+        self._loaded.connect(self._on_loaded)
+
+    def path(self, key):
+        """内容键对应的缩略图文件路径(按前两位十六进制分目录)"""
+        name = key.hex()
+        return os.path.join(self.root, name[:2], name + '.png')
+
+    def pixmap(self, ref):
+        """取得 BlobRef 对应的缩略图，尚未生成时返回 None"""
+        key = ref.key
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+        if key not in self.pending and key not in self.failed:
+            self.pending.add(key)
+            self.executor.submit(self._render, ref)
+        return None
+
+    def _render(self, ref):
+        """读取磁盘缓存，没有时从原图生成并写入磁盘(在后台线程中执行)"""
+        path = self.path(ref.key)
+        try:
+            with open(path, 'rb') as f:
+                self._loaded.emit(ref.key, f.read())
+                return
+        except FileNotFoundError:
+            pass
+
+        data = None
+        try:
+            data = make_thumbnail(self.blob_store.get(ref.key), (THUMBNAIL_MAX_WIDTH, THUMBNAIL_HEIGHT))
+        except Exception as e:
+            print(f"读取图片失败: {e}")
+        if data is None:
+            # 原图无法读取或解码时退回记录中的小缩略图
+            self._loaded.emit(ref.key, ref.preview)
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"保存缩略图失败: {e}")
+        self._loaded.emit(ref.key, data)
+
+    def _on_loaded(self, key, data):
+        """在界面线程中把 PNG 字节转为 QPixmap 放入缓存"""
+        self.pending.discard(key)
+        pixmap = QPixmap()
+        if not data or not pixmap.loadFromData(data):
+            self.failed.add(key)
+            return
+        self.pixmaps[key] = pixmap
+        while len(self.pixmaps) > PIXMAP_CACHE_ITEMS:
+            self.pixmaps.popitem(last=False)
+        self.thumbnailReady.emit(key)
+
+    def discard(self, key):
+        """图片内容被删除时移除缩略图(文件由后台线程删除，排在该内容键尚未完成的生成之后)"""
+        self.pixmaps.pop(key, None)
+        self.failed.discard(key)
+        self.executor.submit(self._remove, key)
+
+    def _remove(self, key):
+        """删除缩略图文件(在后台线程中执行)"""
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"删除缩略图失败: {e}")
+
+    def sweep(self, live_keys):
+        """删除不再被任何历史记录引用的缩略图文件(遍历和删除由后台线程进行)"""
+        live_names = {key.hex() + '.png' for key in live_keys}
+        self.executor.submit(self._sweep, live_names)
+
+    def _sweep(self, live_names):
+        """删除文件名不在 live_names 中的缩略图文件(在后台线程中执行)"""
+        if not os.path.isdir(self.root):
+            return
+        try:
+            for sub in os.listdir(self.root):
+                sub_path = os.path.join(self.root, sub)
+                if not os.path.isdir(sub_path):
+                    continue
+                for name in os.listdir(sub_path):
+                    if name not in live_names:
+                        os.remove(os.path.join(sub_path, name))
+        except OSError as e:
+            print(f"清理缩略图失败: {e}")
+
+    def shutdown(self):
+        """停止后台线程"""
+        self.executor.shutdown(wait=False, cancel_futures=True)